@@ -1,34 +1,369 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+"""
+Sharded vector store: chunks are partitioned by source hash across several Chroma collections.
+
+    python -m backend.app.core.database stats      # Chunks per collection
+    python -m backend.app.core.database rebalance  # Move chunks to their shard (after changing VECTOR_SHARDS or upgrading)
+    python -m backend.app.core.database compact    # Rebuild each shard's HNSW index without deleted entries
+
+rebalance and compact drop and rename collections, which invalidates the collection
+handles of any process that has the store open, so they refuse to run while the API
+(or another tool) holds it.
+"""
+import argparse
+import fcntl
+import hashlib
 import os
+import time
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from backend.app.core.timing import record_stage
+from backend.config import CHROMA_PERSIST_DIRECTORY, VECTOR_SHARDS, VECTOR_COLLECTION_PREFIX
+
+# Collections written before sharding: langchain's default (main.py) and core/database.py's old one.
+LEGACY_COLLECTIONS = ("langchain", "my_collection")
+MIGRATION_PAGE_SIZE = 1000
+LOCK_FILE = ".store.lock"
+COMPACTING_SUFFIX = "__compacting"  # Rebuilt copy of a shard, complete once the original is renamed away
+REPLACED_SUFFIX = "__replaced"  # Original shard, renamed aside before the rebuilt copy takes its name
+
+
+def shard_index(source: str, shard_count: int = VECTOR_SHARDS) -> int:
+    """Stable shard of a source: every chunk of one document lives in the same collection."""
+    return int(hashlib.sha1(source.encode("utf-8")).hexdigest()[:8], 16) % shard_count
+
+
+def _filter_sources(where: Optional[Dict]) -> Optional[List[str]]:
+    """Sources a `where` clause pins the results to, or None if it can match any source."""
+    if not where:
+        return None
+    if "source" in where:
+        value = where["source"]
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, dict) and "$eq" in value:
+            return [value["$eq"]]
+        if isinstance(value, dict) and "$in" in value:
+            return list(value["$in"])
+        return None
+    for clause in where.get("$and", []):
+        sources = _filter_sources(clause)
+        if sources is not None:
+            return sources
+    return None
+
+
+class ShardedVectorStore:
+    """
+    Chroma-compatible vector store spread over `shard_count` collections.
+
+    Writes go through one single-threaded writer per shard, so different shards ingest
+    concurrently while each shard sees its operations in order. Searches fan out to the
+    shards in parallel and merge the per-shard top-k by distance; a `where` clause that
+    pins the source only touches that source's shard. Chunks still in a pre-sharding
+    collection stay readable and deletable until `rebalance` moves them.
+
+    Every open store holds a shared lock on the persist directory; `exclusive=True`
+    (needed by rebalance and compact) takes it exclusively and fails if another
+    process has the store open.
+    """
+
+    def __init__(self, embedding_function: Embeddings, persist_directory: str = CHROMA_PERSIST_DIRECTORY,
+                 shard_count: int = VECTOR_SHARDS, prefix: str = VECTOR_COLLECTION_PREFIX, exclusive: bool = False):
+        import chromadb
+
+        os.makedirs(persist_directory, exist_ok=True)
+        self.embedding_function = embedding_function
+        self.shard_count = shard_count
+        self.exclusive = exclusive
+        self._lock_file = self._acquire_lock(persist_directory, exclusive)
+        self.client = chromadb.PersistentClient(path=persist_directory)
+        self._recover_compaction()
+        self.shards = [self.client.get_or_create_collection(f"{prefix}_{i:02d}") for i in range(shard_count)]
+        shard_names = {shard.name for shard in self.shards}
+        # Legacy collections and shards left over from a larger VECTOR_SHARDS, until rebalanced.
+        self.extra = [
+            self.client.get_collection(name) for name in self._collection_names()
+            if name not in shard_names and (name in LEGACY_COLLECTIONS or name.startswith(f"{prefix}_")) and "__" not in name
+        ]
+        self.extra = [collection for collection in self.extra if collection.count()]
+        if self.extra:
+            logging.warning(f"Chunks found outside the {shard_count} shards in {[c.name for c in self.extra]}; "
+                            f"run 'python -m backend.app.core.database rebalance'")
+        self._writers = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shard-{i}") for i in range(shard_count)]
+        self._readers = ThreadPoolExecutor(max_workers=shard_count + len(self.extra), thread_name_prefix="shard-search")
+
+    @staticmethod
+    def _acquire_lock(persist_directory: str, exclusive: bool):
+        lock_file = open(os.path.join(persist_directory, LOCK_FILE), "a")
+        try:
+            fcntl.flock(lock_file, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if exclusive:
+                lock_file.close()
+                raise RuntimeError(f"The vector store in {persist_directory} is open in another process; stop the API before maintenance")
+            logging.warning(f"Vector store maintenance is running on {persist_directory}; waiting for it to finish")
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+        return lock_file
+
+    def _recover_compaction(self):
+        """Finishes or rolls back a compaction that was interrupted part way through its swap."""
+        names = set(self._collection_names())
+        for name in sorted(names):
+            if name.endswith(REPLACED_SUFFIX):
+                shard = name[:-len(REPLACED_SUFFIX)]
+                if shard not in names:
+                    # Interrupted between the two renames: the rebuilt copy is complete, otherwise keep the original.
+                    survivor = f"{shard}{COMPACTING_SUFFIX}" if f"{shard}{COMPACTING_SUFFIX}" in names else name
+                    self.client.get_collection(survivor).modify(name=shard)
+                    names.add(shard)
+                    logging.warning(f"Restored shard {shard} from {survivor} after an interrupted compaction")
+                if name in self._collection_names():
+                    self.client.delete_collection(name)
+        for name in self._collection_names():
+            if name.endswith(COMPACTING_SUFFIX):
+                # Build never finished (the original was not renamed aside): discard the partial copy.
+                self.client.delete_collection(name)
+                logging.warning(f"Dropped partial compaction copy {name}")
+
+    def _require_exclusive(self, operation: str):
+        if not self.exclusive:
+            raise RuntimeError(f"{operation} renames and drops collections; open the store with exclusive=True (API stopped)")
+
+    def _collection_names(self) -> List[str]:
+        # chromadb >= 0.6 returns names, older versions return Collection objects.
+        return [getattr(c, "name", c) for c in self.client.list_collections()]
+
+    @property
+    def collections(self) -> list:
+        return self.shards + self.extra
+
+    def shard_for(self, source: str):
+        return self.shards[shard_index(source, self.shard_count)]
+
+    def collections_for(self, where: Optional[Dict]) -> list:
+        sources = _filter_sources(where)
+        if sources is None:
+            return self.collections
+        pinned = {shard_index(source, self.shard_count) for source in sources}
+        return [self.shards[i] for i in sorted(pinned)] + self.extra
+
+    def _fan_out(self, collections: list, fn) -> list:
+        if len(collections) == 1:
+            return [fn(collections[0])]
+        return list(self._readers.map(fn, collections))
+
+    # --- Writes ---
+
+    def add_async(self, ids: List[str], documents: List[Document], embeddings: Sequence[Sequence[float]]) -> List[Future]:
+        """Queues upserts of pre-computed vectors on the writers of the shards involved; returns their futures."""
+        by_shard: Dict[int, List[int]] = {}
+        for position, doc in enumerate(documents):
+            by_shard.setdefault(shard_index(doc.metadata.get('source', ''), self.shard_count), []).append(position)
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+
+        def write(shard, positions):
+            started = time.perf_counter()
+            shard.upsert(
+                ids=[ids[p] for p in positions],
+                embeddings=vectors[positions],
+                documents=[documents[p].page_content for p in positions],
+                metadatas=[documents[p].metadata or None for p in positions],
+            )
+            record_stage("chroma_add", time.perf_counter() - started)
 
-logging.basicConfig(level=logging.INFO)
+        return [self._writers[i].submit(write, self.shards[i], positions) for i, positions in by_shard.items()]
 
-CHROMA_DB_PATH = "backend/data/chroma_db"
-os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None, embeddings=None) -> List[str]:
+        ids = ids or [hashlib.sha256(f"{doc.metadata.get('source', '')}\x00{doc.page_content}".encode("utf-8")).hexdigest() for doc in documents]
+        if embeddings is None:
+            encode_documents = getattr(self.embedding_function, "encode_documents", self.embedding_function.embed_documents)
+            embeddings = encode_documents([doc.page_content for doc in documents])
+        for future in self.add_async(ids, documents, embeddings):
+            future.result()
+        return ids
 
-_chroma_client = None  # Global variable for Chroma client
-_chroma_collection_name = "my_collection"  # Global collection name
+    def add_texts(self, texts: List[str], metadatas: Optional[List[Dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        metadatas = metadatas or [{} for _ in texts]
+        return self.add_documents([Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)], ids=ids)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        """Deletes from every shard that may hold the IDs; queued on the writers so it lands after earlier adds."""
+        if not ids and not where:
+            return
+        writers = {id(shard): writer for shard, writer in zip(self.shards, self._writers)}
+        futures = [
+            writers.get(id(c), self._readers).submit(c.delete, ids=ids, where=where)
+            for c in self.collections_for(where)
+        ]
+        for future in futures:
+            future.result()
+
+    # --- Reads ---
+
+    def count(self) -> int:
+        return sum(collection.count() for collection in self.collections)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, list]:
+        """Same result shape as Chroma.get; limit/offset page over the shards' concatenation."""
+        include = list(include)
+        merged: Dict[str, list] = {"ids": [], **{key: [] for key in include}}
+
+        def extend(result):
+            merged["ids"].extend(result["ids"])
+            for key in include:
+                values = result.get(key)
+                merged[key].extend(values if values is not None else [None] * len(result["ids"]))
+
+        collections = self.collections_for(where)
+        if ids is not None or where is not None or (limit is None and not offset):
+            # Lookups by ID and filtered reads touch few rows: fetch from every selected collection, then page.
+            for result in self._fan_out(collections, lambda c: c.get(ids=ids, where=where, include=include)):
+                extend(result)
+            if limit is not None or offset:
+                end = None if limit is None else (offset or 0) + limit
+                merged = {key: values[offset or 0:end] for key, values in merged.items()}
+            return merged
+
+        skip, remaining = offset or 0, limit
+        for collection in collections:
+            if remaining is not None and remaining <= 0:
+                break
+            size = collection.count()
+            if skip >= size:
+                skip -= size
+                continue
+            result = collection.get(include=include, offset=skip, limit=remaining)
+            skip = 0
+            extend(result)
+            if remaining is not None:
+                remaining -= len(result["ids"])
+        return merged
+
+    def _search_collection(self, collection, embedding: Sequence[float], k: int, where: Optional[Dict]) -> List[Tuple[Document, float]]:
+        result = collection.query(query_embeddings=np.asarray(embedding, dtype=np.float32)[None, :], n_results=k, where=where,
+                                  include=["documents", "metadatas", "distances"])
+        return [
+            (Document(id=chunk_id, page_content=text, metadata=metadata or {}), distance)
+            for chunk_id, text, metadata, distance in zip(result["ids"][0], result["documents"][0],
+                                                         result["metadatas"][0], result["distances"][0])
+        ]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: Sequence[float], k: int = 4,
+                                                          filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Top-k (document, distance) pairs across the shards selected by `filter`, nearest first."""
+        collections = [c for c in self.collections_for(filter) if c.count()]
+        hits = [hit for shard_hits in self._fan_out(collections, lambda c: self._search_collection(c, embedding, k, filter))
+                for hit in shard_hits]
+        return sorted(hits, key=lambda hit: hit[1])[:k]
+
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Document]:
+        # CachedEmbeddings hands back the float32 query vector without a list round trip.
+        encode_query = getattr(self.embedding_function, "encode_query", self.embedding_function.embed_query)
+        return self.similarity_search_by_vector(encode_query(query), k, filter)
+
+    # --- Maintenance ---
+
+    def rebalance(self) -> int:
+        """Moves every chunk that is not in its source's shard there; drops emptied non-shard collections. Returns chunks moved."""
+        self._require_exclusive("rebalance")
+        moved = 0
+        for collection in self.collections:
+            offset = 0
+            while True:
+                page = collection.get(include=["embeddings", "documents", "metadatas"], limit=MIGRATION_PAGE_SIZE, offset=offset)
+                if not len(page["ids"]):
+                    break
+                targets: Dict[int, List[int]] = {}
+                for i, metadata in enumerate(page["metadatas"]):
+                    target = shard_index((metadata or {}).get('source', ''), self.shard_count)
+                    if self.shards[target] is not collection:
+                        targets.setdefault(target, []).append(i)
+                for target, rows in targets.items():
+                    self.shards[target].upsert(
+                        ids=[page["ids"][i] for i in rows], embeddings=[list(page["embeddings"][i]) for i in rows],
+                        documents=[page["documents"][i] for i in rows], metadatas=[page["metadatas"][i] for i in rows],
+                    )
+                misplaced = [page["ids"][i] for rows in targets.values() for i in rows]
+                if misplaced:
+                    collection.delete(ids=misplaced)
+                moved += len(misplaced)
+                offset += len(page["ids"]) - len(misplaced)
+            if collection not in self.shards and not collection.count():
+                self.client.delete_collection(collection.name)
+                logging.info(f"Dropped emptied collection {collection.name}")
+        self.extra = [c for c in self.extra if c.name in self._collection_names()]
+        return moved
+
+    def compact(self) -> Dict[str, int]:
+        """
+        Rebuilds each shard into a fresh collection so its HNSW index no longer carries deleted entries.
+
+        The copy takes the shard's name only once it is complete: the original is renamed
+        aside, the copy renamed in, then the original dropped. A crash at any point leaves
+        state that the next open finishes or rolls back (see _recover_compaction).
+        """
+        self._require_exclusive("compact")
+        sizes = {}
+        for i, shard in enumerate(self.shards):
+            name = shard.name
+            rebuilt = self.client.create_collection(f"{name}{COMPACTING_SUFFIX}", metadata=shard.metadata)
+            offset = 0
+            while True:
+                page = shard.get(include=["embeddings", "documents", "metadatas"], limit=MIGRATION_PAGE_SIZE, offset=offset)
+                if not len(page["ids"]):
+                    break
+                rebuilt.upsert(ids=page["ids"], embeddings=[list(v) for v in page["embeddings"]],
+                               documents=page["documents"], metadatas=page["metadatas"])
+                offset += len(page["ids"])
+            if rebuilt.count() != shard.count():
+                self.client.delete_collection(rebuilt.name)
+                raise RuntimeError(f"Compacted copy of {name} has {rebuilt.count()} chunks, expected {shard.count()}; left {name} unchanged")
+            shard.modify(name=f"{name}{REPLACED_SUFFIX}")
+            rebuilt.modify(name=name)
+            self.client.delete_collection(f"{name}{REPLACED_SUFFIX}")
+            self.shards[i] = rebuilt
+            sizes[name] = rebuilt.count()
+            logging.info(f"Compacted {name}: {sizes[name]} chunks")
+        return sizes
+
+    def close(self):
+        for writer in self._writers:
+            writer.shutdown(wait=True)
+        self._readers.shutdown(wait=False)
+        self._lock_file.close()  # Releases the flock
+
+
+_vector_store: Optional[ShardedVectorStore] = None
+
+
+def get_vector_store(embedding_function: Optional[Embeddings] = None) -> ShardedVectorStore:
+    """Process-wide ShardedVectorStore over CHROMA_PERSIST_DIRECTORY."""
+    global _vector_store
+    if _vector_store is None:
+        from backend.app.core.embeddings import get_embedding_function
+
+        _vector_store = ShardedVectorStore(embedding_function or get_embedding_function())
+        logging.info(f"Opened {_vector_store.shard_count} vector shards at {CHROMA_PERSIST_DIRECTORY}")
+    return _vector_store
 
-def get_chroma_client():
-    global _chroma_client
-    if _chroma_client is None:
-        _chroma_client = Chroma(
-            persist_directory=CHROMA_DB_PATH,
-            collection_name=_chroma_collection_name,  # Specify collection here
-            embedding_function=HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        )
-        logging.info(f"Initialized Chroma client at {CHROMA_DB_PATH}, collection={_chroma_collection_name}")
-    return _chroma_client
 
 def initialize_vector_database():
-    """Initializes and returns the Chroma vector database."""
-    db = get_chroma_client()  # Get the client, which also initializes the DB
-    logging.info(f"Retrieved Chroma database client (or initialized) for collection '{_chroma_collection_name}'")
-    return db
+    """Initializes and returns the vector database."""
+    return get_vector_store()
 
-def add_document_to_database(db: Chroma, text: str, metadata: dict):
+
+def add_document_to_database(db: ShardedVectorStore, text: str, metadata: dict):
     """Adds a document and its metadata to the vector database."""
     try:
         db.add_texts([text], metadatas=[metadata])
@@ -37,18 +372,40 @@ def add_document_to_database(db: Chroma, text: str, metadata: dict):
         logging.error(f"Error adding document to database: {e}")
         raise  # Re-raise the exception
 
-def query_vector_database(db: Chroma, query: str, k: int = 2):
+
+def query_vector_database(db: ShardedVectorStore, query: str, k: int = 2):
     """
     Queries the vector database for the top k most similar documents.
 
     Args:
-        db: The Chroma vector database.
+        db: The vector database.
         query: The user's query string.
         k: The number of top results to return.
 
     Returns:
         A list of documents that are most similar to the query.
     """
+    return db.similarity_search(query, k=k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["stats", "rebalance", "compact"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Maintenance never embeds text, so the model is not loaded.
+    store = ShardedVectorStore(embedding_function=None, exclusive=args.command != "stats")
+    try:
+        if args.command == "rebalance":
+            print(f"Moved {store.rebalance()} chunks")
+        elif args.command == "compact":
+            store.compact()
+        for collection in store.collections:
+            print(f"{collection.count():>9}  {collection.name}")
+    finally:
+        store.close()
+
 
-    results = db.similarity_search(query, k=k)  # Pass k directly
-    return results
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Shared embedding server: loads the embedding model once and serves every uvicorn worker
+over a Unix socket, merging concurrent requests into micro-batches.
+
+    python -m backend.app.core.embedding_server      # then run the API with EMBEDDING_BACKEND=remote
+
+Wire format (little-endian). A request is an op byte and a text count, then per text
+a uint32 byte length and its UTF-8 bytes. An embed reply is (rows, dim) followed by
+rows * dim float32 values, which the client reads straight into a numpy buffer; an
+info reply is (key length, dim) followed by the cache key of the served model. A
+failed request is answered with rows = 0xFFFFFFFF and a length-prefixed error message.
+"""
+import argparse
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import logging
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.config import (
+    EMBEDDING_SERVER_SOCKET,
+    EMBEDDING_SERVER_BACKEND,
+    EMBEDDING_SERVER_MAX_BATCH,
+    EMBEDDING_SERVER_MAX_WAIT_MS,
+    EMBEDDING_SERVER_CONNECT_TIMEOUT,
+    EMBEDDING_SERVER_TIMEOUT,
+)
+
+OP_EMBED = 0
+OP_INFO = 1
+ERROR_ROWS = 0xFFFFFFFF
+
+_REQUEST_HEADER = struct.Struct("<BI")
+_REPLY_HEADER = struct.Struct("<II")
+_LENGTH = struct.Struct("<I")
+
+
+def _recv_exact(conn: socket.socket, size: int, allow_eof: bool = False) -> Optional[bytearray]:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = conn.recv_into(view[received:])
+        if n == 0:
+            if allow_eof and received == 0:
+                return None
+            raise ConnectionError("Embedding server connection closed mid-message")
+        received += n
+    return buffer
+
+
+def _send_error(conn: socket.socket, message: str):
+    encoded = message.encode("utf-8")
+    conn.sendall(_REPLY_HEADER.pack(ERROR_ROWS, 0) + _LENGTH.pack(len(encoded)) + encoded)
+
+
+class _PendingRequest:
+    __slots__ = ("texts", "done", "vectors", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+
+
+class EmbeddingServer:
+    """
+    Serves `encode` (texts -> float32 array) to many clients over a Unix socket.
+
+    Each connection gets a thread that parses requests and queues them; a single batcher
+    thread takes the oldest request, keeps collecting until `max_batch` texts are queued
+    or `max_wait` seconds have passed, encodes them in one call and hands each request
+    its rows. A request larger than `max_batch` is never split, only not joined.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], model_key: str, dim: int, socket_path: str = EMBEDDING_SERVER_SOCKET,
+                 max_batch: int = EMBEDDING_SERVER_MAX_BATCH, max_wait: float = EMBEDDING_SERVER_MAX_WAIT_MS / 1000):
+        self.encode = encode
+        self.model_key = model_key
+        self.dim = dim
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._sock: Optional[socket.socket] = None
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)  # Left behind by a previous server that did not shut down cleanly
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self._sock.listen(128)
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        logging.info(f"Embedding server for {self.model_key} listening on {self.socket_path} "
+                     f"(max batch {self.max_batch}, max wait {self.max_wait * 1000:.1f}ms)")
+        try:
+            while True:
+                conn, _ = self._sock.accept()
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self._sock.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def _handle(self, conn: socket.socket):
+        with conn:
+            try:
+                while True:
+                    header = _recv_exact(conn, _REQUEST_HEADER.size, allow_eof=True)
+                    if header is None:
+                        return
+                    op, count = _REQUEST_HEADER.unpack(header)
+                    texts = []
+                    for _ in range(count):
+                        (length,) = _LENGTH.unpack(_recv_exact(conn, _LENGTH.size))
+                        texts.append(_recv_exact(conn, length).decode("utf-8"))
+
+                    if op == OP_INFO:
+                        key = self.model_key.encode("utf-8")
+                        conn.sendall(_REPLY_HEADER.pack(len(key), self.dim) + key)
+                        continue
+                    if op != OP_EMBED:
+                        _send_error(conn, f"Unknown op {op}")
+                        continue
+                    if not texts:
+                        conn.sendall(_REPLY_HEADER.pack(0, self.dim))
+                        continue
+
+                    request = _PendingRequest(texts)
+                    self._queue.put(request)
+                    request.done.wait()
+                    if request.error is not None:
+                        _send_error(conn, request.error)
+                    else:
+                        conn.sendall(_REPLY_HEADER.pack(*request.vectors.shape))
+                        conn.sendall(memoryview(request.vectors).cast("B"))
+            except (ConnectionError, OSError) as e:
+                logging.debug(f"Embedding client disconnected: {e}")
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            self._run(batch)
+
+    def _run(self, batch: List[_PendingRequest]):
+        texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+        try:
+            vectors = np.ascontiguousarray(self.encode(texts), dtype="<f4")
+        except Exception as e:
+            logging.error(f"Embedding batch of {len(texts)} texts failed: {e}", exc_info=True)
+            for request in batch:
+                request.error = str(e)
+                request.done.set()
+            return
+        logging.debug(f"Encoded {len(texts)} texts from {len(batch)} requests in {time.perf_counter() - started:.3f}s")
+        offset = 0
+        for request in batch:
+            request.vectors = vectors[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+            request.done.set()
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Client of the EmbeddingServer. Safe to share between threads: each thread keeps its
+    own connection. `encode` returns a float32 array backed by the bytes read from the
+    socket, without an intermediate copy.
+
+    Waits up to `connect_timeout` seconds for the server to come up, so the API and the
+    server can be started together, and at most `timeout` seconds on any socket operation
+    after that; a server that stops answering raises TimeoutError instead of hanging the caller.
+    """
+
+    def __init__(self, socket_path: str = EMBEDDING_SERVER_SOCKET, connect_timeout: float = EMBEDDING_SERVER_CONNECT_TIMEOUT,
+                 timeout: float = EMBEDDING_SERVER_TIMEOUT):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self._local = threading.local()
+        conn = self._connection()
+        try:
+            conn.sendall(_REQUEST_HEADER.pack(OP_INFO, 0))
+            key_length, self.dim = _REPLY_HEADER.unpack(_recv_exact(conn, _REPLY_HEADER.size))
+            self.model_key = _recv_exact(conn, key_length).decode("utf-8")
+        except socket.timeout:
+            self._drop_connection()
+            raise TimeoutError(f"Embedding server on {self.socket_path} did not answer within {self.timeout}s")
+
+    def _connection(self) -> socket.socket:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                conn.connect(self.socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                conn.close()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"No embedding server on {self.socket_path}; start it with "
+                                          f"python -m backend.app.core.embedding_server")
+                time.sleep(0.5)
+        conn.settimeout(self.timeout)
+        self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        frame = [_REQUEST_HEADER.pack(OP_EMBED, len(texts))]
+        for text in texts:
+            encoded = text.encode("utf-8")
+            frame.append(_LENGTH.pack(len(encoded)))
+            frame.append(encoded)
+        request = b"".join(frame)
+
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.sendall(request)
+                rows, dim = _REPLY_HEADER.unpack(_recv_exact(conn, _REPLY_HEADER.size))
+                if rows == ERROR_ROWS:
+                    (length,) = _LENGTH.unpack(_recv_exact(conn, _LENGTH.size))
+                    raise RuntimeError(f"Embedding server error: {_recv_exact(conn, length).decode('utf-8')}")
+                return np.frombuffer(_recv_exact(conn, rows * dim * 4), dtype="<f4").reshape(rows, dim)
+            except socket.timeout:
+                # The server is alive but wedged or overloaded: resending would only queue more work behind it.
+                # The reply may still arrive, so this connection is out of sync and must not be reused.
+                self._drop_connection()
+                raise TimeoutError(f"Embedding server did not answer {len(texts)} texts within {self.timeout}s")
+            except (ConnectionError, OSError):
+                # The server restarted since this connection was opened; embedding is idempotent, so resend once.
+                self._drop_connection()
+                if attempt:
+                    raise
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def _array_encoder(base: Embeddings) -> Callable[[List[str]], np.ndarray]:
+    # OnnxEmbeddings already produces arrays; the LangChain wrappers return lists.
+    if hasattr(base, "encode"):
+        return base.encode
+    return lambda texts: np.asarray(base.embed_documents(texts), dtype=np.float32)
+
+
+def main():
+    from backend.app.core.embeddings import load_base_embeddings
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=EMBEDDING_SERVER_SOCKET)
+    parser.add_argument("--backend", default=EMBEDDING_SERVER_BACKEND, choices=["sentence-transformers", "onnx"])
+    parser.add_argument("--max-batch", type=int, default=EMBEDDING_SERVER_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBEDDING_SERVER_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    base, model_key = load_base_embeddings(args.backend)
+    encode = _array_encoder(base)
+    dim = encode(["warm-up"]).shape[1]  # Load weights and allocate buffers before accepting clients
+    EmbeddingServer(encode, model_key, dim, args.socket, args.max_batch, args.max_wait_ms / 1000).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
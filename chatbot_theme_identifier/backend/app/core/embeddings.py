@@ -0,0 +1,182 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.config import EMBEDDING_MODEL_NAME, EMBED_BATCH_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+from backend.config import EMBEDDING_BACKEND, EMBEDDING_THREADS, ONNX_MODEL_DIR, ONNX_QUANTIZE
+
+SQLITE_MAX_VARIABLES = 900  # Stay under SQLite's bound-parameter limit in IN (...) clauses
+
+
+class EmbeddingCache:
+    """
+    Disk-backed LRU cache of embedding vectors stored in SQLite.
+
+    Keys are hashes of the model name and text; vectors are stored as float32 blobs.
+    Once the cache holds more than `max_entries` rows the least recently used are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                batch = keys[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    # Copied: frombuffer over the blob is read-only, and callers normalize vectors in place.
+                    found[key] = np.frombuffer(blob, dtype=np.float32).copy()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({placeholders})", [now, *batch]
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows)
+            self._count += self._conn.total_changes - before
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+                logging.info(f"Evicted {overflow} least recently used embeddings from cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a LangChain Embeddings model with an EmbeddingCache.
+
+    Only cache misses reach the model, de-duplicated and encoded `batch_size` texts at a time.
+    `encode_documents`/`encode_query` return float32 arrays, read from the cache
+    blobs and from models that produce arrays (ONNX, the embedding server); the LangChain
+    methods convert those to lists for callers that need them.
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, cache: EmbeddingCache, batch_size: int = EMBED_BATCH_SIZE):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _encode_base(self, texts: List[str]) -> np.ndarray:
+        encode = getattr(self.base, "encode", None)
+        if encode is not None:
+            return np.asarray(encode(texts), dtype=np.float32)
+        return np.asarray(self.base.embed_documents(texts), dtype=np.float32)
+
+    def encode_documents(self, texts: List[str]) -> np.ndarray:
+        keys = [self._key("doc", text) for text in texts]
+        vectors = self.cache.get_many(list(set(keys)))
+
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                misses.setdefault(key, text)
+        miss_keys = list(misses)
+        for i in range(0, len(miss_keys), self.batch_size):
+            batch_keys = miss_keys[i:i + self.batch_size]
+            encoded = self._encode_base([misses[key] for key in batch_keys])
+            batch = dict(zip(batch_keys, encoded))
+            self.cache.put_many(batch)
+            vectors.update(batch)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        logging.info(f"Embedded {len(texts)} texts: {len(texts) - len(miss_keys)} from cache, {len(miss_keys)} encoded")
+        return np.stack([vectors[key] for key in keys])
+
+    def encode_query(self, text: str) -> np.ndarray:
+        key = self._key("query", text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        encode = getattr(self.base, "encode", None)
+        vector = encode([text])[0] if encode is not None else np.asarray(self.base.embed_query(text), dtype=np.float32)
+        self.cache.put_many({key: vector})
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode_documents(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode_query(text).tolist()
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def load_base_embeddings(backend: str = EMBEDDING_BACKEND) -> Tuple[Embeddings, str]:
+    """The embedding model of `backend` and the name its vectors are cached under (distinct per backend)."""
+    if backend == "remote":
+        from backend.app.core.embedding_server import RemoteEmbeddings
+
+        # Cached under the served model's key, so a cache filled in-process stays valid.
+        remote = RemoteEmbeddings()
+        return remote, remote.model_key
+    if backend == "onnx":
+        from backend.app.core.onnx_embeddings import OnnxEmbeddings, export_onnx_model, onnx_model_path
+
+        if not os.path.exists(onnx_model_path(ONNX_MODEL_DIR, ONNX_QUANTIZE)):
+            logging.info(f"No ONNX model in {ONNX_MODEL_DIR}, exporting {EMBEDDING_MODEL_NAME}")
+            export_onnx_model(EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR, ONNX_QUANTIZE)
+        return OnnxEmbeddings(ONNX_MODEL_DIR, ONNX_QUANTIZE), f"{EMBEDDING_MODEL_NAME}:onnx-{'int8' if ONNX_QUANTIZE else 'fp32'}"
+    if backend != "sentence-transformers":
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected 'sentence-transformers', 'onnx' or 'remote'")
+
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+
+    if EMBEDDING_THREADS:
+        import torch
+        torch.set_num_threads(EMBEDDING_THREADS)
+    base = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs={"batch_size": EMBED_BATCH_SIZE})
+    return base, EMBEDDING_MODEL_NAME
+
+
+def get_embedding_function() -> CachedEmbeddings:
+    """Builds the cached embedding function (EMBEDDING_BACKEND) shared by ingestion and queries."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+    base, model_key = load_base_embeddings()
+    return CachedEmbeddings(base, model_key, _embedding_cache)
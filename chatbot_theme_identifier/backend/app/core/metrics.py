@@ -0,0 +1,33 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_duration_seconds", "Duration of one pipeline stage invocation", ["stage"], buckets=DURATION_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "chatbot_http_request_duration_seconds", "Time from request start to the last response byte", ["method", "route", "status"],
+    buckets=DURATION_BUCKETS,
+)
+PAGES_PARSED = Counter("chatbot_pages_parsed_total", "PDF pages parsed for text")
+OCR_PAGES = Counter("chatbot_ocr_pages_total", "Scanned PDF pages run through OCR")
+CHUNKS_EMBEDDED = Counter("chatbot_chunks_embedded_total", "Chunks embedded and written to the vector store")
+CHUNKS_DELETED = Counter("chatbot_chunks_deleted_total", "Stale chunks removed from the vector store")
+LLM_REQUESTS = Counter("chatbot_llm_requests_total", "Groq chat completions by outcome", ["model", "outcome"])
+LLM_TOKENS = Counter("chatbot_llm_tokens_total", "Groq token usage reported by the API", ["model", "kind"])
+ERRORS = Counter("chatbot_errors_total", "Errors handled by the pipeline, by stage", ["stage"])
+STARTUP_PHASE_SECONDS = Gauge("chatbot_startup_phase_seconds", "Time spent in each startup phase", ["phase"])
+READY = Gauge("chatbot_ready", "1 once the embedding model and vector store are warmed up")
+
+
+def record_llm_usage(model: str, usage):
+    """Adds a completion's `usage` block (prompt/completion tokens) to LLM_TOKENS; a missing block is ignored."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def render_metrics():
+    """Body and content type for the Prometheus /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+from backend.app.core.metrics import HTTP_REQUEST_SECONDS
+from backend.app.core.profiling import SlowRequestProfiler
+from backend.app.core.timing import collect_request_stages
+
+
+def _server_timing(stages: Dict[str, float], total: float) -> bytes:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries).encode("latin-1")
+
+
+class RequestInstrumentationMiddleware:
+    """
+    ASGI middleware that times each HTTP request end to end.
+
+    Stage timings recorded while the request runs are summed per stage and sent in a
+    `Server-Timing` header; for streamed responses only the stages finished before the
+    first byte are included. The full duration, up to the last body chunk, goes to
+    HTTP_REQUEST_SECONDS and, when a profiler is configured, decides whether the
+    sampled stacks of the request are kept.
+    """
+
+    def __init__(self, app, profiler: Optional[SlowRequestProfiler] = None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        session = self.profiler.start() if self.profiler else None
+        status = 500
+
+        with collect_request_stages() as stages:
+            async def send_with_timing(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(stages, time.perf_counter() - started)))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                elapsed = time.perf_counter() - started
+                # The router stores the matched route in the scope; label by its template, not the raw path.
+                route = getattr(scope.get("route"), "path", "unmatched")
+                HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+                if session is not None:
+                    await asyncio.to_thread(self.profiler.finish, session, f"{scope['method']} {scope['path']}", elapsed)
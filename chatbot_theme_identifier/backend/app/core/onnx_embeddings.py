@@ -0,0 +1,212 @@
+"""
+ONNX Runtime backend for the sentence-transformers embedding model.
+
+    python -m backend.app.core.onnx_embeddings export    # PyTorch -> ONNX -> int8 dynamic quantization
+    python -m backend.app.core.onnx_embeddings compare   # Cosine parity and throughput against PyTorch
+
+Runtime inference only needs onnxruntime and tokenizers; exporting additionally needs
+torch, sentence-transformers and onnx.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import logging
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.config import (
+    EMBEDDING_MODEL_NAME,
+    EMBED_BATCH_SIZE,
+    EMBEDDING_THREADS,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZE,
+    CHROMA_PERSIST_DIRECTORY,
+)
+
+FP32_MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedding_config.json"
+
+
+def onnx_model_path(model_dir: str, quantize: bool) -> str:
+    return os.path.join(model_dir, INT8_MODEL_FILE if quantize else FP32_MODEL_FILE)
+
+
+def export_onnx_model(model_name: str = EMBEDDING_MODEL_NAME, model_dir: str = ONNX_MODEL_DIR, quantize: bool = ONNX_QUANTIZE) -> str:
+    """
+    Exports the transformer of a sentence-transformers model to ONNX, optionally with int8
+    dynamic quantization of its weights. Writes the tokenizer and pooling settings next to it.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(model_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    dummy = tokenizer(["warm-up sentence"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(model_dir, FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    tokenizer.save_pretrained(model_dir)
+    normalize = any(type(module).__name__ == "Normalize" for module in st_model)
+    with open(os.path.join(model_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "max_seq_length": st_model.max_seq_length, "normalize": normalize}, f, indent=2)
+
+    if not quantize:
+        return fp32_path
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(model_dir, INT8_MODEL_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    logging.info(f"Exported {model_name} to {int8_path} ({os.path.getsize(fp32_path) >> 20} MiB fp32 -> {os.path.getsize(int8_path) >> 20} MiB int8)")
+    return int8_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Mean-pooled sentence embeddings from an exported ONNX model, run with ONNX Runtime on CPU.
+
+    Texts are sorted by length before batching so each batch pads to a similar size, and
+    the vectors are returned in input order. `threads` caps ONNX Runtime's intra-op pool
+    (0 lets the runtime pick).
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, quantize: bool = ONNX_QUANTIZE, threads: int = EMBEDDING_THREADS,
+                 batch_size: int = EMBED_BATCH_SIZE):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.normalize = config["normalize"]
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(onnx_model_path(model_dir, quantize), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        batches = [
+            self._encode_batch([texts[i] for i in order[start:start + self.batch_size]])
+            for start in range(0, len(order), self.batch_size)
+        ]
+        vectors = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        vectors[order] = np.concatenate(batches)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def _sample_texts(input_path: Optional[str], limit: int) -> List[str]:
+    if input_path:
+        with open(input_path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:limit]
+    from backend.app.core.database import ShardedVectorStore
+
+    texts = ShardedVectorStore(embedding_function=None, persist_directory=CHROMA_PERSIST_DIRECTORY).get(limit=limit, include=["documents"])["documents"]
+    if not texts:
+        raise SystemExit(f"No chunks in {CHROMA_PERSIST_DIRECTORY}; pass --input with one text per line")
+    return texts
+
+
+def compare(texts: List[str], threads: int, batch_size: int, min_cosine: float) -> bool:
+    """Prints cosine parity and throughput of the PyTorch and ONNX backends; returns whether parity holds."""
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    reference_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    candidates = {"onnx-fp32": OnnxEmbeddings(quantize=False, threads=threads, batch_size=batch_size)}
+    if os.path.exists(onnx_model_path(ONNX_MODEL_DIR, True)):
+        candidates["onnx-int8"] = OnnxEmbeddings(quantize=True, threads=threads, batch_size=batch_size)
+
+    def timed(encode):
+        encode(texts[:batch_size])  # Warm-up: first runs allocate arenas and pick kernels
+        started = time.perf_counter()
+        vectors = np.asarray(encode(texts), dtype=np.float32)
+        return vectors, len(texts) / (time.perf_counter() - started)
+
+    reference, reference_rate = timed(lambda batch: reference_model.encode(batch, batch_size=batch_size))
+    reference /= np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    print(f"{'backend':<14}{'texts/s':>10}{'speedup':>9}{'min cos':>10}{'mean cos':>10}")
+    print(f"{'pytorch':<14}{reference_rate:>10.1f}{1.0:>8.2f}x{1.0:>10.4f}{1.0:>10.4f}")
+
+    ok = True
+    for name, embeddings in candidates.items():
+        vectors, rate = timed(embeddings.encode)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        cosine = (vectors * reference).sum(axis=1)
+        print(f"{name:<14}{rate:>10.1f}{rate / reference_rate:>8.2f}x{cosine.min():>10.4f}{cosine.mean():>10.4f}")
+        ok = ok and cosine.min() >= min_cosine
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export", "compare"])
+    parser.add_argument("--no-quantize", action="store_true", help="export: only write the fp32 model")
+    parser.add_argument("--input", default=None, help="compare: text file, one sample per line (default: chunks from ChromaDB)")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="compare: exit nonzero if any vector is less similar than this")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        print(export_onnx_model(quantize=not args.no_quantize))
+    elif not compare(_sample_texts(args.input, args.samples), args.threads, args.batch_size, args.min_cosine):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# Innermost frames of threads that are parked rather than working; those samples are dropped.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfileSession:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stacks: Counter = Counter()
+
+
+def _collapsed_stack(frame) -> Optional[str]:
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in statistical profiler for slow requests.
+
+    While at least one request is in flight, a daemon thread samples the stacks of all
+    threads every `interval_seconds`. When a request finishes slower than
+    `threshold_seconds`, the samples taken during it are written to `output_dir` in
+    collapsed-stack format. Samples are process-wide, so a profile also contains the
+    work of requests that overlapped with the slow one.
+    """
+
+    def __init__(self, threshold_seconds: float, interval_seconds: float, output_dir: str):
+        self.threshold_seconds = threshold_seconds
+        self.interval_seconds = interval_seconds
+        self.output_dir = output_dir
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> ProfileSession:
+        session = ProfileSession()
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def finish(self, session: ProfileSession, label: str, elapsed: float) -> Optional[str]:
+        """Stops sampling for `session`; returns the profile path if the request was slow enough to keep."""
+        with self._lock:
+            self._sessions.discard(session)
+        if elapsed < self.threshold_seconds or not session.stacks:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{elapsed * 1000:.0f}ms.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logging.warning(f"Slow request {label} took {elapsed:.2f}s; wrote {sum(session.stacks.values())} stack samples to {path}")
+        return path
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                sessions = list(self._sessions)
+            stacks = [
+                stack for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id and (stack := _collapsed_stack(frame)) is not None
+            ]
+            for session in sessions:
+                session.stacks.update(stacks)
+            time.sleep(self.interval_seconds)
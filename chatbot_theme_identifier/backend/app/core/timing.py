@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+
+from backend.app.core.metrics import STAGE_SECONDS
+
+MAX_SAMPLES_PER_STAGE = 100_000
+
+_lock = threading.Lock()
+_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=MAX_SAMPLES_PER_STAGE))
+# Per-request stage totals. asyncio tasks and asyncio.to_thread copy the context, so they all add to the same dict.
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    """Records one duration for a pipeline stage (parse, ocr, embed, search, llm_answer, ...)."""
+    with _lock:
+        _samples[name].append(seconds)
+        request_stages = _request_stages.get()
+        if request_stages is not None:
+            request_stages[name] = request_stages.get(name, 0.0) + seconds
+    STAGE_SECONDS.labels(name).observe(seconds)
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_request_stages():
+    """Yields a dict that accumulates the seconds spent in each stage recorded within this context."""
+    stages: Dict[str, float] = {}
+    token = _request_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _request_stages.reset(token)
+
+
+def stage_samples() -> Dict[str, List[float]]:
+    with _lock:
+        return {name: list(samples) for name, samples in _samples.items()}
+
+
+def reset_stages():
+    with _lock:
+        _samples.clear()
@@ -1,32 +1,68 @@
+import time
+_import_started = time.perf_counter()  # Startup timings reported by /ready are measured from here
+
 from fastapi import FastAPI, UploadFile, Form, File, HTTPException
-from typing import List, Optional, Dict, Any
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-import pytesseract
-from PIL import Image
-from langchain_community.vectorstores import Chroma
-import uuid
+from typing import List, Optional, Dict, Any, Tuple
 import os
 from pydantic import BaseModel, Field
-from groq import Groq
 import logging
 from langchain_core.documents import Document
-from collections import defaultdict
 import json # <--- ADD THIS IMPORT
+from collections import defaultdict
+import asyncio
+import functools
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-import fitz
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from backend.config import INGEST_WORKERS, INGEST_MAX_PENDING_JOBS, INGEST_JOB_RETENTION, INGEST_MANIFEST_PATH, EMBED_BATCH_SIZE
+from backend.config import INGEST_RECORD_BATCH, INGEST_FILES_IN_FLIGHT
+from backend.config import QUERY_CACHE_TTL_SECONDS, QUERY_CACHE_MAX_ENTRIES, LEXICAL_INDEX_PATH, CHROMA_PERSIST_DIRECTORY
+from backend.config import THEME_SOURCE, THEME_INDEX_PATH, THEME_MAX_PER_QUERY
+from backend.config import THEME_CONTEXT_TOKEN_BUDGET, ANSWER_CONTEXT_TOKEN_BUDGET
+from backend.config import PROFILE_SLOW_REQUEST_SECONDS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_OUTPUT_DIR
+from backend.config import SUPPORTED_UPLOAD_EXTENSIONS
+from backend.app.core.database import ShardedVectorStore
+from backend.app.core.embeddings import get_embedding_function
+from backend.app.core.metrics import CHUNKS_DELETED, CHUNKS_EMBEDDED, ERRORS, READY, STARTUP_PHASE_SECONDS, render_metrics
+from backend.app.core.middleware import RequestInstrumentationMiddleware
+from backend.app.core.profiling import SlowRequestProfiler
+from backend.app.core.timing import stage, record_stage
+from backend.app.services.ingestion_jobs import IngestionJobQueue, JobProgress, JobStatus, QueueFullError
+from backend.app.services.document_processing import iter_document_records
+from backend.app.services.pdf_extraction import shutdown_pools
+from backend.app.services.ingest_manifest import IngestManifest, chunk_id, file_sha256
+from backend.app.services.upload_store import UploadStore, UploadTooLargeError
+from backend.app.services.query_cache import QueryResponseCache
+from backend.app.services.lexical_index import LexicalIndex
+from backend.app.services.retrieval import HybridRetriever, backfill_lexical_index
+from backend.app.services.theme_index import ThemeIndex
+from backend.app.services.context_packing import rank_passages, pack_snippets
+from backend.app.services.llm_client import create_chat_completion, stream_chat_completion, close_llm_client
 
 # Define the Pydantic model for your query request
 class QueryRequest(BaseModel):
     query: str = Field(..., min_length=1)
     output_format: Optional[str] = None
+    k: int = Field(5, ge=1, le=50)
+    source: Optional[str] = None  # Restrict retrieval to one document
+    page_number: Optional[int] = Field(None, ge=1)
 
 app = FastAPI()
 @app.get("/")
 def root():
+    """Liveness probe; answers as soon as the process serves HTTP. Use /ready for traffic routing."""
     return {"message": "Backend is up and running."}
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once the embedding model and vector store are loaded and warmed up, 503 until then."""
+    return JSONResponse(status_code=200 if startup_state["status"] == "ready" else 503, content=startup_state)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -42,128 +78,329 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+app.add_middleware(
+    RequestInstrumentationMiddleware,
+    profiler=SlowRequestProfiler(PROFILE_SLOW_REQUEST_SECONDS, PROFILE_SAMPLE_INTERVAL_MS / 1000, PROFILE_OUTPUT_DIR)
+    if PROFILE_SLOW_REQUEST_SECONDS > 0 else None,
 )
 
 # Global variables
-db = None
+db: Optional[ShardedVectorStore] = None
 embedding_function = None
+ingestion_queue: Optional[IngestionJobQueue] = None
+lexical_index: Optional[LexicalIndex] = None
+retriever: Optional[HybridRetriever] = None
+theme_index: Optional[ThemeIndex] = None
+ingest_manifest = IngestManifest(INGEST_MANIFEST_PATH)
+_source_locks: Dict[str, List] = {}  # source -> [lock, holders + waiters]
+_source_locks_guard = threading.Lock()
+upload_store: Optional[UploadStore] = None
+query_cache = QueryResponseCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS)
+startup_state: Dict[str, Any] = {"status": "starting", "error": None, "ready_after_seconds": None, "phases": {}}
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 logging.basicConfig(level=logging.INFO)
 if not GROQ_API_KEY:
     logging.warning("GROQ_API_KEY is not set in environment variables")
 
-@app.on_event("startup")
-async def startup_event():
-    global db, embedding_function
-    embedding_function = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-    db = Chroma(persist_directory="backend/data/chroma_db", embedding_function=embedding_function)
+def _startup_phase(name: str, started: float):
+    elapsed = time.perf_counter() - started
+    startup_state["phases"][name] = round(elapsed, 3)
+    STARTUP_PHASE_SECONDS.labels(name).set(elapsed)
+
+def _warm_up():
+    """
+    Loads the embedding model, vector store and indexes off the event loop, then runs one
+    query embedding and vector search so the first real request finds them hot.
+    """
+    global db, embedding_function, lexical_index, retriever, theme_index
+    try:
+        started = time.perf_counter()
+        embedding_function = get_embedding_function()
+        _startup_phase("embedding_model", started)
+
+        started = time.perf_counter()
+        db = ShardedVectorStore(embedding_function, CHROMA_PERSIST_DIRECTORY)
+        _startup_phase("vector_store", started)
+
+        started = time.perf_counter()
+        lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+        retriever = HybridRetriever(db, lexical_index)
+        theme_index = ThemeIndex(THEME_INDEX_PATH)
+        _startup_phase("indexes", started)
+
+        started = time.perf_counter()
+        # Straight to the model: an embedding cache hit would skip the lazy initialisation this is meant to trigger.
+        warm_up_vector = embedding_function.base.embed_query("warm-up")
+        corpus_empty = not db.count()
+        if not corpus_empty:
+            db.similarity_search_by_vector(warm_up_vector, k=1)  # Loads every shard's HNSW index into memory
+        _startup_phase("warm_up", started)
+    except Exception as e:
+        logging.error(f"Startup warm-up failed: {e}", exc_info=True)
+        ERRORS.labels("startup").inc()
+        startup_state.update(status="failed", error=str(e))
+        return
 
-def is_potential_paragraph_start(block):
-    x0 = block[0]
-    return x0 > 50
+    startup_state.update(status="ready", ready_after_seconds=round(time.perf_counter() - _import_started, 3))
+    READY.set(1)
+    logging.info(f"Ready {startup_state['ready_after_seconds']:.2f}s after import; phases: {startup_state['phases']}")
+    if len(lexical_index) == 0 and not corpus_empty:
+        backfill_lexical_index(db, lexical_index)
 
-def load_and_store_documents(file_paths: List[str]):
-    global db
-    documents = []
+def _require_ready():
+    if startup_state["status"] != "ready":
+        raise HTTPException(status_code=503, detail=f"Backend is {startup_state['status']}, retry later.", headers={"Retry-After": "5"})
 
-    print("--- Running the paragraph-grouping load_and_store_documents ---")
+@app.on_event("startup")
+async def startup_event():
+    """Starts serving immediately; the model and vector store are loaded by a background warm-up (see /ready)."""
+    global ingestion_queue, upload_store
+    _startup_phase("import", _import_started)
+    upload_store = UploadStore()
+    ingestion_queue = IngestionJobQueue(INGEST_WORKERS, INGEST_MAX_PENDING_JOBS, INGEST_JOB_RETENTION)
+    asyncio.get_running_loop().run_in_executor(None, _warm_up)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if ingestion_queue is not None:
+        ingestion_queue.shutdown()
+    shutdown_pools()
+    if db is not None:
+        db.close()
+    await close_llm_client()
+
+def _delete_chunks(chunk_ids: List[str], source: Optional[str] = None):
+    if chunk_ids:
+        # Pinning the source limits the delete to that source's shard.
+        where = {"source": source} if source else None
+        members = theme_index.members(list(chunk_ids))
+        # Theme centroids are un-averaged with the vectors, so read them before they are deleted.
+        stored = db.get(ids=members, where=where, include=["embeddings"]) if members else {"ids": [], "embeddings": []}
+        db.delete(ids=list(chunk_ids), where=where)
+        lexical_index.delete(chunk_ids)
+        theme_index.remove_chunks(chunk_ids, dict(zip(stored["ids"], stored["embeddings"])))
+
+@contextlib.contextmanager
+def _source_lock(source: str):
+    """
+    Serializes syncs of one source (two jobs uploading the same file name) without
+    blocking other sources. Always taken before ingest_manifest.lock, never inside it.
+    """
+    with _source_locks_guard:
+        entry = _source_locks.setdefault(source, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _source_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _source_locks[source]
+
+def _purge_removed_files() -> int:
+    """Drops the chunks of manifest entries whose file no longer exists on disk."""
+    purged = 0
+    for source in ingest_manifest.sources():
+        with _source_lock(source):
+            entry = ingest_manifest.get(source)
+            if entry is None or os.path.exists(entry.get("path", source)):
+                continue
+            with ingest_manifest.lock:
+                ingest_manifest.remove(source)
+            _delete_chunks(entry.get("chunk_ids", []), source)
+            purged += 1
+            logging.info(f"Purged {len(entry.get('chunk_ids', []))} chunks of removed file {source}")
+    return purged
+
+def _records_in_batches(records, batch_size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _sync_source(source: str, file_hash: str, stored_path: Optional[str], text_splitter, progress: Optional[JobProgress]):
+    """
+    Streams one changed file into the stores; returns (chunks added, chunks deleted).
+    The caller holds the source's lock.
+
+    Paragraph records are split and embedded INGEST_RECORD_BATCH at a time, so only
+    one batch of text and the chunk IDs seen so far are held in memory. The manifest
+    entry and stale-chunk deletion wait until the whole file has been read; if
+    extraction fails part way, the chunks already added for it are rolled back.
+    """
+    entry = ingest_manifest.get(source)
+    if entry is None:
+        # Chunks stored before the manifest existed carry random IDs; replace them wholesale.
+        old_ids = set(db.get(where={"source": source}, include=[])["ids"])
+    else:
+        old_ids = set(entry["chunk_ids"])
 
-    for file_path in file_paths:
+    seen_ids = set()
+    added_ids = []
+    pending_writes = []
+    try:
+        records = iter_document_records(stored_path or source, source, progress)
+        for records_batch in _records_in_batches(records, INGEST_RECORD_BATCH):
+            with stage("split"):
+                split_docs = text_splitter.split_documents(records_batch)
+            new_chunks = {}
+            for doc in split_docs:
+                if not doc.page_content.strip():
+                    continue
+                doc_chunk_id = chunk_id(source, doc.metadata['page_number'], doc.page_content)
+                if doc_chunk_id in seen_ids:
+                    continue  # identical chunks on a page are stored once
+                seen_ids.add(doc_chunk_id)
+                if doc_chunk_id not in old_ids:
+                    doc.metadata['chunk_id'] = doc_chunk_id
+                    new_chunks[doc_chunk_id] = doc
+
+            new_ids = list(new_chunks)
+            for i in range(0, len(new_ids), EMBED_BATCH_SIZE):
+                batch_ids = new_ids[i:i + EMBED_BATCH_SIZE]
+                batch_docs = [new_chunks[chunk] for chunk in batch_ids]
+                batch_texts = [doc.page_content for doc in batch_docs]
+                with stage("embed"):
+                    batch_vectors = embedding_function.encode_documents(batch_texts)
+                # Written by the source's shard writer while the next batch is embedded.
+                pending_writes.extend(db.add_async(batch_ids, batch_docs, batch_vectors))
+                added_ids.extend(batch_ids)
+                with stage("lexical_add"):
+                    lexical_index.add(
+                        (chunk, doc.page_content, source, doc.metadata['page_number']) for chunk, doc in zip(batch_ids, batch_docs)
+                    )
+                if len(theme_index):
+                    theme_index.add_chunks(batch_ids, batch_vectors, batch_texts, [doc.metadata for doc in batch_docs])
+                CHUNKS_EMBEDDED.inc(len(batch_ids))
+            if progress and new_ids:
+                progress.chunks_embedded(source, len(new_ids))
+        for future in pending_writes:
+            future.result()
+    except Exception:
+        for future in pending_writes:
+            future.exception()  # Let queued writes land before deleting them
+        _delete_chunks(added_ids, source)
+        raise
+
+    stale_ids = old_ids - seen_ids
+    _delete_chunks(list(stale_ids), source)
+    CHUNKS_DELETED.inc(len(stale_ids))
+    with ingest_manifest.lock:
+        ingest_manifest.set(source, file_hash, list(seen_ids), stored_path)
+    return len(added_ids), len(stale_ids)
+
+def _sync_file(file_path: str, stored_path: Optional[str], text_splitter, progress: Optional[JobProgress]) -> Tuple[bool, int, int]:
+    """Syncs one file unless its content hash matches the manifest; returns (changed, chunks added, chunks deleted)."""
+    with _source_lock(file_path):
         try:
-            doc = fitz.open(file_path)
-            for page_num in range(doc.page_count):
-                page = doc.load_page(page_num)
-
-                page_text_content = ""
-                if not page.get_text("text").strip() and len(page.get_images()) > 0:
-                    logging.info(f"Page {page_num + 1} of {file_path} appears scanned. Attempting OCR.")
-                    pix = page.get_pixmap()
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    try:
-                        page_text_content = pytesseract.image_to_string(img)
-                        ocr_blocks = []
-                        for para_text in page_text_content.split('\n\n'):
-                            if para_text.strip():
-                                ocr_blocks.append((0.0, 0.0, 0.0, 0.0, para_text.strip(), 0, 0))
-                        blocks = ocr_blocks
-                    except Exception as ocr_e:
-                        logging.error(f"Error during OCR for page {page_num + 1} of {file_path}: {ocr_e}")
-                        blocks = []
-                else:
-                    blocks = page.get_text("blocks")
-
-                current_paragraph = ""
-                current_paragraph_blocks = []
-
-                for i, block in enumerate(blocks):
-                    text_content = block[4].strip()
-
-                    if text_content:
-                        is_new_paragraph_start = False
-                        if len(block) > 4 and isinstance(block[0], (int, float)):
-                            is_new_paragraph_start = is_potential_paragraph_start(block)
-                        else:
-                            pass
-
-                        if is_new_paragraph_start and current_paragraph:
-                            doc_id = str(uuid.uuid4())
-                            metadata = {
-                                'document_id': doc_id,
-                                'source': file_path,
-                                'page_number': page_num + 1,
-                                'paragraph_start': current_paragraph_blocks[0][0] if current_paragraph_blocks and isinstance(current_paragraph_blocks[0][0], (int, float)) else 0.0,
-                                'paragraph_end': current_paragraph_blocks[-1][2] if current_paragraph_blocks and isinstance(current_paragraph_blocks[-1][2], (int, float)) else 0.0,
-                            }
-                            documents.append(Document(page_content=current_paragraph, metadata=metadata))
-                            current_paragraph = text_content
-                            current_paragraph_blocks = [block]
-                        else:
-                            if not current_paragraph:
-                                current_paragraph = text_content
-                            else:
-                                current_paragraph += " " + text_content
-                            current_paragraph_blocks.append(block)
-
-            if current_paragraph:
-                doc_id = str(uuid.uuid4())
-                metadata = {
-                    'document_id': doc_id,
-                    'source': file_path,
-                    'page_number': page_num + 1,
-                    'paragraph_start': current_paragraph_blocks[0][0] if current_paragraph_blocks and isinstance(current_paragraph_blocks[0][0], (int, float)) else 0.0,
-                    'paragraph_end': current_paragraph_blocks[-1][2] if current_paragraph_blocks and isinstance(current_paragraph_blocks[-1][2], (int, float)) else 0.0,
-                }
-                documents.append(Document(page_content=current_paragraph, metadata=metadata))
+            file_hash = file_sha256(stored_path or file_path)
+        except OSError as e:
+            logging.error(f"Error hashing file {file_path}: {e}")
+            if progress:
+                progress.file_failed(file_path, str(e))
+            return False, 0, 0
+        entry = ingest_manifest.get(file_path)
+        if entry and entry["file_hash"] == file_hash:
+            logging.info(f"Skipping unchanged file {file_path}")
+            if progress:
+                progress.file_completed(file_path)
+            return False, 0, 0
 
+        try:
+            added, deleted = _sync_source(file_path, file_hash, stored_path, text_splitter, progress)
         except Exception as e:
             logging.error(f"Error processing file {file_path}: {e}", exc_info=True)
-
-    print("\n--- Documents before splitting ---")
-    for doc in documents:
-        print(f"   Metadata: {doc.metadata}")
-        print(f"   Content: {doc.page_content[:100]}...\n")
-
+            ERRORS.labels("ingest").inc()
+            if progress:
+                progress.file_failed(file_path, str(e))
+            return True, 0, 0
+    if progress:
+        progress.file_completed(file_path)
+    return True, added, deleted
+
+def load_and_store_documents(file_paths: List[str], progress: Optional[JobProgress] = None,
+                             stored_paths: Optional[Dict[str, str]] = None):
+    """
+    Incrementally syncs `file_paths` into ChromaDB.
+
+    Files whose content hash matches the manifest are skipped. Changed files are
+    re-extracted through the extractor registered for their type and streamed through
+    splitting and embedding; only the chunks whose deterministic ID is new are embedded,
+    and chunks that disappeared are deleted. Up to INGEST_FILES_IN_FLIGHT files are
+    synced at once, so their page ranges share the parse/OCR pools and their writes
+    overlap on different shards. Manifest entries for files that no longer exist on
+    disk are purged. `stored_paths` maps a source to the file holding its bytes when
+    they differ (uploads live in the content-addressed UploadStore).
+    """
     from langchain.text_splitter import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    docs = [doc for doc in text_splitter.split_documents(documents) if doc.page_content.strip()]
-
-    if docs:
-        db.add_documents(docs)
-        logging.info(f"Added {len(docs)} document chunks to ChromaDB from {file_paths}")
-    else:
-        logging.warning("No valid documents to add to ChromaDB.")
 
-@app.post("/upload/")
+    stored_paths = stored_paths or {}
+    added = deleted = changed = 0
+    if file_paths:
+        with ThreadPoolExecutor(max_workers=min(INGEST_FILES_IN_FLIGHT, len(file_paths)), thread_name_prefix="ingest-file") as files:
+            results = files.map(lambda path: _sync_file(path, stored_paths.get(path), text_splitter, progress), file_paths)
+            for file_changed, file_added, file_deleted in results:
+                changed += file_changed
+                added += file_added
+                deleted += file_deleted
+
+    purged = _purge_removed_files()
+    with ingest_manifest.lock:
+        if added or deleted or purged:
+            ingest_manifest.bump_version()
+            if len(theme_index):
+                theme_index.save()
+        ingest_manifest.save()
+
+    logging.info(f"Synced {changed} changed files ({len(file_paths) - changed} unchanged): "
+                 f"{added} chunks added, {deleted} deleted, {purged} removed files purged")
+
+@app.post("/upload/", status_code=202)
 async def upload_documents(files: List[UploadFile]):
-    """Handles document uploads."""
-    file_paths = []
+    """Streams the uploaded files into the content-addressed upload store and queues them for background ingestion."""
+    _require_ready()
+    unsupported = [f.filename for f in files if os.path.splitext(f.filename or "")[1].lower() not in SUPPORTED_UPLOAD_EXTENSIONS]
+    if unsupported:
+        raise HTTPException(status_code=415, detail=f"Unsupported file types {unsupported}; accepted: {list(SUPPORTED_UPLOAD_EXTENSIONS)}")
+    stored_uploads = []
     for file in files:
-        file_path = f"backend/data/temp/{file.filename}"
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        file_paths.append(file_path)
-    load_and_store_documents(file_paths)
-    return {"message": "Documents uploaded and processed successfully"}
+        try:
+            stored_uploads.append(await asyncio.to_thread(upload_store.store, file.file, file.filename))
+        except UploadTooLargeError as e:
+            # Nothing from this request gets ingested, so don't leave its files behind unreferenced.
+            for stored in stored_uploads:
+                upload_store.discard(stored)
+            raise HTTPException(status_code=413, detail=str(e))
+    stored_paths = {stored.source: stored.path for stored in stored_uploads}
+    try:
+        job = ingestion_queue.submit(list(stored_paths), functools.partial(load_and_store_documents, stored_paths=stored_paths))
+    except QueueFullError:
+        for stored in stored_uploads:
+            upload_store.discard(stored)
+        raise HTTPException(status_code=503, detail="Ingestion queue is full, retry later.", headers={"Retry-After": "30"})
+    for stored in stored_uploads:
+        upload_store.claim(stored)
+    return {
+        "message": "Documents uploaded and queued for processing",
+        "job_id": job.job_id,
+        "status_url": f"/jobs/{job.job_id}",
+    }
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str):
+    """Reports per-file ingestion progress for an upload job."""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
 
 class Citation(BaseModel):
     document_id: str
@@ -178,9 +415,7 @@ class ThemeResponse(BaseModel): # <--- MODIFIED
     theme_description: Optional[str] = None # Added for description
     citations: List[Citation]
 
-def extract_themes_with_citations(query: str, relevant_documents: List[Document]) -> Dict[str, Any]:
-    global GROQ_API_KEY
-
+def _build_snippets(relevant_documents: List[Document]):
     unique_snippets_with_metadata = []
     # Create a mapping from display ID (e.g., DOC001) to actual Document object for easy lookup
     doc_id_map = {}
@@ -191,8 +426,31 @@ def extract_themes_with_citations(query: str, relevant_documents: List[Document]
              doc.metadata.get('paragraph_start', 0.0), doc.metadata.get('paragraph_end', 0.0))
         )
         doc_id_map[display_doc_id] = doc # Store the original document object
+    return unique_snippets_with_metadata, doc_id_map
+
+def _pack_context(query: str, doc_id_map: Dict[str, Document]):
+    """
+    Merges overlapping chunks, orders them by MMR and fits them into the theme and answer
+    prompt token budgets. Returns (theme_snippets, answer_snippets) in _build_snippets' tuple shape.
+    """
+    if not doc_id_map:
+        return [], []
+    # Both the query and the chunk texts were embedded during retrieval/ingestion, so these hit the cache.
+    query_vector = embedding_function.encode_query(query)
+    doc_vectors = dict(zip(doc_id_map, embedding_function.encode_documents([doc.page_content for doc in doc_id_map.values()])))
+    with stage("context_pack"):
+        passages = rank_passages(query_vector, doc_id_map, doc_vectors)
+    return pack_snippets(passages, THEME_CONTEXT_TOKEN_BUDGET), pack_snippets(passages, ANSWER_CONTEXT_TOKEN_BUDGET)
+
+async def _packed_snippets(query: str, unique_snippets_with_metadata, doc_id_map: Dict[str, Document]):
+    try:
+        return await asyncio.to_thread(_pack_context, query, doc_id_map)
+    except Exception as e:
+        logging.error(f"Error packing context, sending unpacked snippets: {e}", exc_info=True)
+        ERRORS.labels("context_pack").inc()
+        return unique_snippets_with_metadata, unique_snippets_with_metadata
 
-    # --- LLM-Based Theme Extraction (JSON Output) ---
+def _build_theme_prompt(query: str, unique_snippets_with_metadata) -> str:
     context_prompt_for_themes = "\n\n".join(
         f"DOC ID: {doc_id}\nSnippet: {snippet}" for snippet, doc_id, _, _, _, _ in unique_snippets_with_metadata)
 
@@ -227,55 +485,9 @@ def extract_themes_with_citations(query: str, relevant_documents: List[Document]
     Text Snippets:
     {context_prompt_for_themes}
     """
-    extracted_themes_data = [] # Initialize as empty list
-    try:
-        client = Groq(api_key=GROQ_API_KEY)
-        theme_completion = client.chat.completions.create(
-            messages=[
-                {"role": "user", "content": theme_prompt}
-            ],
-            model="llama3-8b-8192",
-            response_format={"type": "json_object"} # <--- CRITICAL: Request JSON output
-        )
-        themes_raw_json = theme_completion.choices[0].message.content
-        # Assuming Groq returns clean JSON, if not, you might need to strip markdown ```json ... ```
-        parsed_themes_response = json.loads(themes_raw_json)
-        extracted_themes_data = parsed_themes_response.get("themes", []) # Get the array under the "themes" key
-
-        extracted_themes_for_response = []
-        for theme_item in extracted_themes_data:
-            theme_citations = []
-            for doc_id_llm in theme_item.get("document_ids", []):
-                if doc_id_llm in doc_id_map: # Check if the LLM provided DOC ID exists
-                    doc_orig = doc_id_map[doc_id_llm]
-                    citation = Citation(
-                        document_id=doc_id_llm, # Use the display ID like DOC001
-                        source=doc_orig.metadata.get('source', 'unknown'),
-                        page_number=doc_orig.metadata.get('page_number', 1),
-                        paragraph_start=doc_orig.metadata.get('paragraph_start', 0.0),
-                        paragraph_end=doc_orig.metadata.get('paragraph_end', 0.0),
-                        snippet_text=doc_orig.page_content,
-                    )
-                    theme_citations.append(citation)
-
-            extracted_themes_for_response.append(ThemeResponse(
-                theme_name=theme_item.get("theme_name", "Unknown Theme"),
-                theme_description=theme_item.get("theme_description"),
-                citations=theme_citations
-            ))
-        extracted_themes = extracted_themes_for_response # This is now a list of ThemeResponse objects
+    return theme_prompt
 
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding JSON from Groq themes: {e}", exc_info=True)
-        extracted_themes = [ThemeResponse(theme_name="Theme Extraction Error", theme_description="Could not parse themes from LLM. Raw response might be invalid JSON.", citations=[])]
-    except Exception as e:
-        extracted_themes = [ThemeResponse(theme_name="Theme Extraction Error", theme_description=f"Error extracting themes: {e}", citations=[])]
-        logging.error(f"Error extracting themes: {e}", exc_info=True)
-
-    if not extracted_themes:
-        extracted_themes = [ThemeResponse(theme_name="No Themes Identified", theme_description="The LLM did not identify any specific themes.", citations=[])]
-
-    # --- LLM-Based Answer Generation ---
+def _build_answer_prompt(query: str, unique_snippets_with_metadata) -> str:
     context_prompt_answer = "\n\n".join(
         f"Source: {source}, Page: {page}, Paragraph Start: {p_start}, Paragraph End: {p_end}\nSnippet: {snippet}"
         for snippet, _, source, page, p_start, p_end in unique_snippets_with_metadata)
@@ -291,21 +503,123 @@ def extract_themes_with_citations(query: str, relevant_documents: List[Document]
     Snippets:
     {context_prompt_answer}
     """
+    return llm_prompt
+
+def _parse_themes(themes_raw_json: str, doc_id_map: Dict[str, Document]) -> List[ThemeResponse]:
+    # Assuming Groq returns clean JSON, if not, you might need to strip markdown ```json ... ```
+    parsed_themes_response = json.loads(themes_raw_json)
+    extracted_themes_data = parsed_themes_response.get("themes", []) # Get the array under the "themes" key
+
+    extracted_themes_for_response = []
+    for theme_item in extracted_themes_data:
+        theme_citations = []
+        for doc_id_llm in theme_item.get("document_ids", []):
+            if doc_id_llm in doc_id_map: # Check if the LLM provided DOC ID exists
+                # Use the display ID like DOC001
+                theme_citations.append(_citation_for(doc_id_llm, doc_id_map[doc_id_llm]))
+
+        extracted_themes_for_response.append(ThemeResponse(
+            theme_name=theme_item.get("theme_name", "Unknown Theme"),
+            theme_description=theme_item.get("theme_description"),
+            citations=theme_citations
+        ))
+    return extracted_themes_for_response
+
+def _themes_from_index(doc_id_map: Dict[str, Document]) -> List[ThemeResponse]:
+    """Themes for the retrieved documents via nearest-centroid lookup in the corpus theme index."""
+    theme_index.reload_if_changed()
+    if not len(theme_index) or not doc_id_map:
+        return []
+    # Retrieved chunk texts were embedded at ingestion, so these are embedding-cache hits.
+    labels = theme_index.nearest_themes(embedding_function.encode_documents([doc.page_content for doc in doc_id_map.values()]))
+
+    docs_by_theme = defaultdict(list)
+    for (display_doc_id, doc), label in zip(doc_id_map.items(), labels):
+        docs_by_theme[label].append((display_doc_id, doc))
+
+    extracted_themes = []
+    for label in sorted(docs_by_theme, key=lambda label: -len(docs_by_theme[label]))[:THEME_MAX_PER_QUERY]:
+        theme = theme_index.themes[label]
+        extracted_themes.append(ThemeResponse(
+            theme_name=theme["theme_name"],
+            theme_description=theme.get("theme_description"),
+            citations=[_citation_for(display_doc_id, doc) for display_doc_id, doc in docs_by_theme[label]],
+        ))
+    return extracted_themes
+
+ANSWER_ERROR_TEXT = "Error generating answer."
+THEME_ERROR_NAME = "Theme Extraction Error"
+
+def _cacheable_response(response: Dict[str, Any]) -> bool:
+    """False for responses degraded by an LLM failure, so a burst of errors is not served from the cache for the whole TTL."""
+    return response.get("answer") != ANSWER_ERROR_TEXT and not any(
+        theme["theme_name"] == THEME_ERROR_NAME for theme in response.get("themes", [])
+    )
+
+async def _generate_themes(query: str, unique_snippets_with_metadata, doc_id_map: Dict[str, Document]) -> List[ThemeResponse]:
+    """Theme extraction: corpus theme index when available, otherwise the LLM (JSON output)."""
+    if THEME_SOURCE == "index":
+        try:
+            with stage("theme_lookup"):
+                indexed_themes = await asyncio.to_thread(_themes_from_index, doc_id_map)
+            if indexed_themes:
+                return indexed_themes
+        except Exception as e:
+            logging.error(f"Error looking up themes in the theme index, falling back to the LLM: {e}", exc_info=True)
+            ERRORS.labels("theme_lookup").inc()
+
+    theme_prompt = _build_theme_prompt(query, unique_snippets_with_metadata)
     try:
-        client = Groq(api_key=GROQ_API_KEY)
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "user", "content": llm_prompt}
-            ],
-            model="llama3-8b-8192",
-        )
-        llm_text = chat_completion.choices[0].message.content
+        with stage("llm_themes"):
+            theme_completion = await create_chat_completion(
+                messages=[
+                    {"role": "user", "content": theme_prompt}
+                ],
+                response_format={"type": "json_object"} # <--- CRITICAL: Request JSON output
+            )
+        extracted_themes = _parse_themes(theme_completion.choices[0].message.content, doc_id_map)
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding JSON from Groq themes: {e}", exc_info=True)
+        ERRORS.labels("llm_themes").inc()
+        extracted_themes = [ThemeResponse(theme_name=THEME_ERROR_NAME, theme_description="Could not parse themes from LLM. Raw response might be invalid JSON.", citations=[])]
+    except Exception as e:
+        extracted_themes = [ThemeResponse(theme_name=THEME_ERROR_NAME, theme_description=f"Error extracting themes: {e}", citations=[])]
+        logging.error(f"Error extracting themes: {e}", exc_info=True)
+        ERRORS.labels("llm_themes").inc()
+
+    if not extracted_themes:
+        extracted_themes = [ThemeResponse(theme_name="No Themes Identified", theme_description="The LLM did not identify any specific themes.", citations=[])]
+    return extracted_themes
+
+async def _generate_answer(query: str, unique_snippets_with_metadata) -> str:
+    """LLM-based answer generation."""
+    llm_prompt = _build_answer_prompt(query, unique_snippets_with_metadata)
+    try:
+        with stage("llm_answer"):
+            chat_completion = await create_chat_completion(
+                messages=[
+                    {"role": "user", "content": llm_prompt}
+                ],
+            )
+        return chat_completion.choices[0].message.content
     except Exception as e:
-        llm_text = "Error generating answer."
         logging.error(f"Error generating answer: {e}", exc_info=True)
+        ERRORS.labels("llm_answer").inc()
+        return ANSWER_ERROR_TEXT
+
+async def extract_themes_with_citations(query: str, relevant_documents: List[Document]) -> Dict[str, Any]:
+    """Runs the theme and answer completions concurrently and combines them into the /query/ response."""
+    unique_snippets_with_metadata, doc_id_map = _build_snippets(relevant_documents)
+    theme_snippets, answer_snippets = await _packed_snippets(query, unique_snippets_with_metadata, doc_id_map)
+
+    extracted_themes, llm_text = await asyncio.gather(
+        _generate_themes(query, theme_snippets, doc_id_map),
+        _generate_answer(query, answer_snippets),
+    )
 
     # --- Combine Themes and Answer ---
     final_response: Dict[str, Any] = {
+        "citations": [_citation_for(doc_id, doc).model_dump() for doc_id, doc in doc_id_map.items()],
         "themes": [t.model_dump() for t in extracted_themes], # Convert Pydantic models to dicts for JSON serialization
         "answer": llm_text,
         "original_query": query,
@@ -313,33 +627,149 @@ def extract_themes_with_citations(query: str, relevant_documents: List[Document]
     }
     return final_response
 
-@app.post("/query/")
-async def query_documents(request: QueryRequest):
-    """Handles user queries against the stored documents."""
-    global db
-
+def _citation_for(display_doc_id: str, doc: Document) -> Citation:
+    return Citation(
+        document_id=display_doc_id,
+        source=doc.metadata.get('source', 'unknown'),
+        page_number=doc.metadata.get('page_number', 1),
+        paragraph_start=doc.metadata.get('paragraph_start', 0.0),
+        paragraph_end=doc.metadata.get('paragraph_end', 0.0),
+        snippet_text=doc.page_content,
+    )
+
+def _tabular_results(relevant_documents: List[Document]) -> List[Dict[str, Any]]:
+    tabular_results = []
+    for i, doc in enumerate(relevant_documents):
+        doc_id = f"DOC{i + 1:03d}"
+        tabular_results.append({
+            "Document ID": doc_id,
+            "Extracted Answer": doc.page_content[:200],
+            "Citation": f"{doc.metadata.get('source', 'unknown')}, Page: {doc.metadata.get('page_number')}, Paragraph Start-End: {doc.metadata.get('paragraph_start')}-{doc.metadata.get('paragraph_end')}"
+        })
+    return tabular_results
+
+def _retrieve(request: QueryRequest) -> List[Document]:
+    return retriever.search(request.query, k=request.k, source=request.source, page_number=request.page_number)
+
+def _cache_key(request: QueryRequest):
+    return QueryResponseCache.make_key(
+        request.query, request.output_format, request.k, ingest_manifest.corpus_version,
+        source=request.source, page_number=request.page_number,
+    )
+
+async def _answer_query(request: QueryRequest) -> Dict[str, Any]:
     user_query = request.query
     output_format = request.output_format
+    relevant_documents = await asyncio.to_thread(_retrieve, request)
 
-    relevant_documents = db.similarity_search(user_query, k=5)
+    if output_format == "tabular":
+        return {"tabular_results": _tabular_results(relevant_documents)}
 
-    final_response = extract_themes_with_citations(user_query, relevant_documents)
+    # final_response['themes'] is already a list of dicts (ThemeResponse.model_dump()),
+    # so it can be returned as is.
+    return await extract_themes_with_citations(user_query, relevant_documents)
 
-    if output_format == "tabular":
-        tabular_results = []
-        for i, doc in enumerate(relevant_documents):
-            doc_id = f"DOC{i + 1:03d}"
-            tabular_results.append({
-                "Document ID": doc_id,
-                "Extracted Answer": doc.page_content[:200],
-                "Citation": f"{doc.metadata.get('source', 'unknown')}, Page: {doc.metadata.get('page_number')}, Paragraph Start-End: {doc.metadata.get('paragraph_start')}-{doc.metadata.get('paragraph_end')}"
-            })
-        return {"tabular_results": tabular_results}
-    else:
-        # In this else block, final_response['themes'] already contains ThemeResponse objects
-        # that are converted to dicts by model_dump() right before returning from extract_themes_with_citations.
-        # So, we can directly return final_response, as it's already structured correctly.
-        return final_response # This should be the structure already, no need to re-process themes here
+@app.post("/query/")
+async def query_documents(request: QueryRequest):
+    """Handles user queries against the stored documents."""
+    _require_ready()
+    return await query_cache.get_or_compute(_cache_key(request), lambda: _answer_query(request), _cacheable_response)
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_query_events(request: QueryRequest):
+    """
+    Yields the /query/stream events: `citations` (or `tabular`), then `token` deltas of
+    the answer, then `themes`, then `done` carrying the same body /query/ would return.
+    """
+    cache_key = _cache_key(request)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        if "tabular_results" in cached:
+            yield _sse("tabular", cached["tabular_results"])
+        else:
+            yield _sse("citations", cached.get("citations", []))
+            yield _sse("token", {"text": cached["answer"]})
+            yield _sse("themes", cached["themes"])
+        yield _sse("done", cached)
+        return
+
+    relevant_documents = await asyncio.to_thread(_retrieve, request)
+
+    if request.output_format == "tabular":
+        final_response = {"tabular_results": _tabular_results(relevant_documents)}
+        yield _sse("tabular", final_response["tabular_results"])
+        query_cache.put(cache_key, final_response)
+        yield _sse("done", final_response)
+        return
+
+    unique_snippets_with_metadata, doc_id_map = _build_snippets(relevant_documents)
+    citations = [_citation_for(doc_id, doc).model_dump() for doc_id, doc in doc_id_map.items()]
+    yield _sse("citations", citations)
+
+    theme_snippets, answer_snippets = await _packed_snippets(request.query, unique_snippets_with_metadata, doc_id_map)
+    themes_task = asyncio.create_task(_generate_themes(request.query, theme_snippets, doc_id_map))
+    try:
+        answer_parts = []
+        try:
+            llm_prompt = _build_answer_prompt(request.query, answer_snippets)
+            answer_started = time.perf_counter()
+            async for delta in stream_chat_completion(messages=[{"role": "user", "content": llm_prompt}]):
+                answer_parts.append(delta)
+                yield _sse("token", {"text": delta})
+            record_stage("llm_answer", time.perf_counter() - answer_started)
+            llm_text = "".join(answer_parts)
+        except Exception as e:
+            logging.error(f"Error generating answer: {e}", exc_info=True)
+            ERRORS.labels("llm_answer").inc()
+            llm_text = ANSWER_ERROR_TEXT
+            yield _sse("error", {"message": llm_text})
+
+        extracted_themes = await themes_task
+        themes = [t.model_dump() for t in extracted_themes]
+        yield _sse("themes", themes)
+
+        final_response = {
+            "citations": citations,
+            "themes": themes,
+            "answer": llm_text,
+            "original_query": request.query,
+            "original_llm_response": llm_text
+        }
+        if _cacheable_response(final_response):
+            query_cache.put(cache_key, final_response)
+        yield _sse("done", final_response)
+    finally:
+        themes_task.cancel()  # No-op once finished; stops the theme call if the client disconnects
+
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Server-Sent Events variant of /query/ that streams citations, answer tokens and themes as they are ready."""
+    _require_ready()
+    return StreamingResponse(
+        _stream_query_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/themes")
+async def list_themes():
+    """Corpus-wide themes from the theme index, with their sizes and representative citations."""
+    _require_ready()
+    theme_index.reload_if_changed()
+    return {"themes": theme_index.summary()}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss statistics for the /query/ response cache."""
+    return {"query_cache": query_cache.stats(), "corpus_version": ingest_manifest.corpus_version}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus exposition of stage latencies, ingestion/LLM counters and errors."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from backend.config import CONTEXT_MMR_LAMBDA
+
+MIN_OVERLAP_CHARS = 20  # Shorter shared runs are treated as coincidence, not splitter overlap
+MAX_OVERLAP_CHARS = 400  # Comfortably above the splitter's 200-character chunk_overlap
+CHARS_PER_TOKEN = 4  # Rough llama3 tokenizer ratio for English text
+NEAR_DUPLICATE_SIMILARITY = 0.97  # Passages this close to an already selected one are dropped
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _suffix_prefix_overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b`, or 0 if under MIN_OVERLAP_CHARS."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = max(0, len(a) - MAX_OVERLAP_CHARS)
+    while True:
+        pos = a.find(probe, start)
+        if pos == -1:
+            return 0
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        start = pos + 1
+
+
+class PackedPassage:
+    """One or more retrieved chunks from the same source/page, merged where their text overlaps."""
+
+    def __init__(self, doc_id: str, doc: Document):
+        self.doc_ids = [doc_id]
+        self.documents = [doc]
+        self.text = doc.page_content
+        self.source = doc.metadata.get('source', 'unknown')
+        self.page_number = doc.metadata.get('page_number', 1)
+        self.paragraph_start = doc.metadata.get('paragraph_start', 0.0)
+        self.paragraph_end = doc.metadata.get('paragraph_end', 0.0)
+
+    def try_merge(self, doc_id: str, doc: Document) -> bool:
+        if (doc.metadata.get('source', 'unknown'), doc.metadata.get('page_number', 1)) != (self.source, self.page_number):
+            return False
+        text = doc.page_content
+        if text in self.text:
+            merged = self.text
+        elif self.text in text:
+            merged = text
+        elif (overlap := _suffix_prefix_overlap(self.text, text)):
+            merged = self.text + text[overlap:]
+        elif (overlap := _suffix_prefix_overlap(text, self.text)):
+            merged = text + self.text[overlap:]
+        else:
+            return False
+        self.text = merged
+        self.doc_ids.append(doc_id)
+        self.documents.append(doc)
+        self.paragraph_start = min(self.paragraph_start, doc.metadata.get('paragraph_start', 0.0))
+        self.paragraph_end = max(self.paragraph_end, doc.metadata.get('paragraph_end', 0.0))
+        return True
+
+    def as_snippet(self, text: Optional[str] = None):
+        """Same tuple shape as the per-document snippets: (text, doc ids, source, page, start, end)."""
+        return (text or self.text, ", ".join(self.doc_ids), self.source, self.page_number, self.paragraph_start, self.paragraph_end)
+
+
+def merge_overlapping(doc_id_map: Dict[str, Document]) -> List[PackedPassage]:
+    """Collapses chunks that overlap or contain each other within a source/page into single passages."""
+    passages: List[PackedPassage] = []
+    for doc_id, doc in doc_id_map.items():
+        if not any(passage.try_merge(doc_id, doc) for passage in passages):
+            passages.append(PackedPassage(doc_id, doc))
+    return passages
+
+
+def mmr_order(query_vector: Sequence[float], passage_vectors: Sequence[Sequence[float]], lambda_: float = CONTEXT_MMR_LAMBDA) -> List[int]:
+    """
+    Orders passages by maximal marginal relevance: relevance to the query minus similarity
+    to those already picked. Near-duplicates of a picked passage are dropped altogether.
+    """
+    if not len(passage_vectors):
+        return []
+    # Not in place: asarray returns float32 inputs themselves, which belong to the caller.
+    P = np.asarray(passage_vectors, dtype=np.float32)
+    P = P / np.maximum(np.linalg.norm(P, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query_vector, dtype=np.float32)
+    q = q / max(np.linalg.norm(q), 1e-12)
+
+    relevance = P @ q
+    pairwise = P @ P.T
+    selected = [int(np.argmax(relevance))]
+    remaining = set(range(len(P))) - set(selected)
+    while remaining:
+        candidates = list(remaining)
+        redundancy = pairwise[np.ix_(candidates, selected)].max(axis=1)
+        scores = lambda_ * relevance[candidates] - (1 - lambda_) * redundancy
+        best_position = int(np.argmax(scores))
+        best = candidates[best_position]
+        remaining.remove(best)
+        if redundancy[best_position] < NEAR_DUPLICATE_SIMILARITY:
+            selected.append(best)
+    return selected
+
+
+def rank_passages(query_vector: Sequence[float], doc_id_map: Dict[str, Document], doc_vectors: Dict[str, Sequence[float]]) -> List[PackedPassage]:
+    """Merges overlapping chunks, then orders the passages by MMR using the mean vector of their chunks."""
+    passages = merge_overlapping(doc_id_map)
+    passage_vectors = [np.mean([doc_vectors[doc_id] for doc_id in passage.doc_ids], axis=0) for passage in passages]
+    return [passages[i] for i in mmr_order(query_vector, passage_vectors)]
+
+
+def pack_snippets(passages: List[PackedPassage], token_budget: int) -> List[tuple]:
+    """
+    Takes passages in order while they fit in `token_budget` and returns them as snippet tuples.
+    Passages that do not fit are skipped; the first one is truncated if it alone exceeds the budget.
+    """
+    snippets = []
+    used = 0
+    for passage in passages:
+        text = passage.text
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            if snippets:
+                continue
+            text = text[:token_budget * CHARS_PER_TOKEN]
+            tokens = token_budget
+        snippets.append(passage.as_snippet(text))
+        used += tokens
+    return snippets
@@ -1,35 +1,165 @@
-import PyPDF2
+import hashlib
 import os
-from typing import Optional
+import time
 import logging
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-logging.basicConfig(level=logging.DEBUG)  # Or logging.INFO
+from langchain_core.documents import Document
 
-def extract_text_from_pdf(pdf_path: str) -> Optional[str]:
-    """Extracts text from a PDF file."""
-    text = ""
-    try:
-        logging.debug(f"Attempting to open PDF: {pdf_path}")
-        with open(pdf_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            logging.debug(f"PDF opened successfully. Pages: {len(reader.pages)}")
-            for page in reader.pages:
-                text += page.extract_text() or ""
-            logging.debug("Text extraction complete.")
-        return text
-    except Exception as e:
-        logging.error(f"Error extracting text from {pdf_path}: {e}", exc_info=True)  # Log with traceback
-        return None
+from backend.app.core.metrics import ERRORS, OCR_PAGES
+from backend.app.core.timing import record_stage
 
-def process_document(file_path: str) -> Optional[str]:
-    """Processes a document based on its file type."""
+# An extractor takes (path to read, source recorded in the metadata, optional JobProgress)
+# and lazily yields paragraph Documents in reading order.
+Extractor = Callable[..., Iterator[Document]]
+
+EXTRACTORS: Dict[str, Extractor] = {}
+
+
+def register_extractor(*extensions: str):
+    """Registers the decorated function as the extractor for files with the given extensions."""
+    def decorator(extract: Extractor) -> Extractor:
+        for extension in extensions:
+            EXTRACTORS[extension.lower()] = extract
+        return extract
+    return decorator
+
+
+def paragraph_document(source: str, page_num: int, paragraph: str, start: float = 0.0, end: float = 0.0) -> Document:
+    """
+    A paragraph record. Every extractor produces this metadata shape; `page_num` is
+    zero-based, `start`/`end` are the paragraph's horizontal extent where the format has one.
+    """
+    return Document(page_content=paragraph, metadata={
+        'document_id': hashlib.sha1(f"{source}\x00{page_num}\x00{paragraph}".encode("utf-8")).hexdigest(),
+        'source': source,
+        'page_number': page_num + 1,
+        'paragraph_start': start,
+        'paragraph_end': end,
+    })
+
+
+def extractor_for(file_path: str) -> Optional[Extractor]:
+    return EXTRACTORS.get(os.path.splitext(file_path)[1].lower())
+
+
+def iter_document_records(file_path: str, source: Optional[str] = None, progress=None) -> Iterator[Document]:
+    """
+    Yields the paragraph records of a file through the extractor registered for its extension.
+
+    `source` is recorded in the metadata when it differs from the file read (content-addressed
+    uploads keep the uploaded file's extension, so dispatch works on either). Raises
+    ValueError for unsupported types; extractor errors propagate to the caller.
+    """
+    source = source or file_path
+    extract = extractor_for(file_path) or extractor_for(source)
+    if extract is None:
+        raise ValueError(f"Unsupported file type: {os.path.splitext(source)[1]}")
+    return extract(file_path, source, progress)
+
+
+@register_extractor(".pdf")
+def _extract_pdf(file_path: str, source: str, progress=None) -> Iterator[Document]:
+    from backend.app.services.pdf_extraction import iter_pdf_paragraphs
+
+    return iter_pdf_paragraphs(file_path, source, progress)
 
-    _, file_extension = os.path.splitext(file_path)
-    logging.info(f"Processing file: {file_path} with extension {file_extension}")
 
-    if file_extension.lower() == ".pdf":
-        text_content = extract_text_from_pdf(file_path)
-        return text_content
-    else:
-        logging.warning(f"Unsupported file type: {file_extension}")
-        return None
\ No newline at end of file
+@register_extractor(".docx")
+def _extract_docx(file_path: str, source: str, progress=None) -> Iterator[Document]:
+    """Paragraphs and table rows of a Word document; explicit and rendered page breaks advance the page number."""
+    import docx
+    from docx.oxml.ns import qn
+    from docx.table import Table
+
+    document = docx.Document(file_path)
+    if progress:
+        progress.file_started(source)
+    page_num = 0
+    for block in document.iter_inner_content():
+        if isinstance(block, Table):
+            for row in block.rows:
+                text = " | ".join(cell.text.strip() for cell in row.cells)
+                if text.strip(" |"):
+                    yield paragraph_document(source, page_num, text)
+            continue
+        if block.text.strip():
+            yield paragraph_document(source, page_num, block.text.strip())
+        breaks = sum(1 for br in block._p.iter(qn('w:br')) if br.get(qn('w:type')) == 'page')
+        breaks += sum(1 for _ in block._p.iter(qn('w:lastRenderedPageBreak')))
+        if breaks:
+            page_num += breaks
+            if progress:
+                progress.page_parsed(source, breaks)
+
+
+@register_extractor(".txt", ".md")
+def _extract_text(file_path: str, source: str, progress=None) -> Iterator[Document]:
+    """Blank-line separated paragraphs, read line by line; form feeds start a new page."""
+    if progress:
+        progress.file_started(source)
+    page_num = 0
+    lines: List[str] = []
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            pages = line.split("\f")
+            for i, part in enumerate(pages):
+                if i:
+                    if lines:
+                        yield paragraph_document(source, page_num, "\n".join(lines))
+                        lines = []
+                    page_num += 1
+                    if progress:
+                        progress.page_parsed(source)
+                if part.strip():
+                    lines.append(part.strip())
+                elif lines:
+                    yield paragraph_document(source, page_num, "\n".join(lines))
+                    lines = []
+    if lines:
+        yield paragraph_document(source, page_num, "\n".join(lines))
+
+
+def _ocr_image(file_path: str) -> Tuple[List[str], float]:
+    """Runs in an OCR worker. Returns the Tesseract text of every frame (multi-page TIFFs have several) and the seconds spent."""
+    import pytesseract
+    from PIL import Image, ImageSequence
+
+    started = time.perf_counter()
+    with Image.open(file_path) as image:
+        texts = [pytesseract.image_to_string(frame.convert("RGB")) for frame in ImageSequence.Iterator(image)]
+    return texts, time.perf_counter() - started
+
+
+@register_extractor(".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+def _extract_image(file_path: str, source: str, progress=None) -> Iterator[Document]:
+    """OCRs an image on the shared OCR pool; each frame is a page."""
+    from backend.app.services.pdf_extraction import get_ocr_pool, ocr_text_blocks
+
+    if progress:
+        progress.file_started(source)
+    try:
+        texts, elapsed = get_ocr_pool().submit(_ocr_image, file_path).result()
+    except Exception:
+        ERRORS.labels("ocr").inc()
+        raise
+    record_stage("ocr", elapsed)
+    OCR_PAGES.inc(len(texts))
+    for page_num, text in enumerate(texts):
+        if progress:
+            progress.page_parsed(source)
+        for block in ocr_text_blocks(text):
+            yield paragraph_document(source, page_num, block[4])
+
+
+def process_document(file_path: str) -> Optional[str]:
+    """Extracts the text of a document of any registered type, paragraphs separated by blank lines."""
+    logging.info(f"Processing file: {file_path}")
+    try:
+        return "\n\n".join(record.page_content for record in iter_document_records(file_path))
+    except ValueError as e:
+        logging.warning(str(e))
+        return None
+    except Exception as e:
+        logging.error(f"Error extracting text from {file_path}: {e}", exc_info=True)
+        return None
@@ -0,0 +1,146 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import logging
+from typing import Dict, List, Optional
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """Hashes a file in fixed-size blocks so large uploads are never read into memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, page_number: int, content: str) -> str:
+    """Deterministic chunk ID: identical text at the same source/page always maps to the same ID."""
+    return hashlib.sha256(f"{source}\x00{page_number}\x00{content}".encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    JSON manifest of what has been ingested, keyed by source path.
+
+    Each entry records the file's content hash and the chunk IDs stored in Chroma for it,
+    which lets re-ingestion skip unchanged files and diff the chunks of changed ones.
+    The manifest also carries a corpus version that is bumped whenever the stored
+    chunks change, so caches of query results can tell when they are stale.
+
+    Several API workers share the file. Each keeps the entries it has changed since its
+    last save as pending; reads pick up other processes' saves, and `save` re-reads the
+    file under an exclusive flock and writes it back with only this process's changes
+    applied, so workers never overwrite each other's entries.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict] = {}
+        self._version = 0
+        self._pending: Dict[str, Optional[Dict]] = {}  # Unsaved changes; None marks a removal
+        self._pending_bump = False
+        self._loaded_mtime: Optional[float] = None
+        self._load()
+
+    def _load(self):
+        """Re-reads the file and re-applies this process's unsaved changes on top of it."""
+        entries, version = {}, 0
+        if os.path.exists(self.path):
+            try:
+                self._loaded_mtime = os.path.getmtime(self.path)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                entries, version = data.get("files", {}), data.get("corpus_version", 0)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error(f"Could not read ingest manifest {self.path}, starting empty: {e}")
+        for source, entry in self._pending.items():
+            if entry is None:
+                entries.pop(source, None)
+            else:
+                entries[source] = entry
+        self._entries = entries
+        self._version = version + 1 if self._pending_bump else version
+
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._loaded_mtime:
+            self._load()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        with self._lock, self._file_lock():
+            self._load()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"corpus_version": self._version, "files": self._entries}, f)
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = os.path.getmtime(self.path)
+            self._pending.clear()
+            self._pending_bump = False
+
+    def bump_version(self) -> int:
+        with self._lock:
+            if not self._pending_bump:
+                self._pending_bump = True
+                self._version += 1
+            return self._version
+
+    @property
+    def corpus_version(self) -> int:
+        """Current corpus version, re-read from disk if another process has saved the manifest since."""
+        # Never wait on an in-progress sync here; this is called on the request path.
+        if self._lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self._version
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    def get(self, source: str) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            return self._entries.get(source)
+
+    def set(self, source: str, file_hash: str, chunk_ids: List[str], path: Optional[str] = None):
+        """`path` records where the bytes live when that differs from `source` (content-addressed uploads)."""
+        with self._lock:
+            self._refresh()
+            entry = {"file_hash": file_hash, "chunk_ids": sorted(chunk_ids)}
+            if path and path != source:
+                entry["path"] = path
+            self._entries[source] = entry
+            self._pending[source] = entry
+
+    def remove(self, source: str) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            self._pending[source] = None
+            return self._entries.pop(source, None)
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            self._refresh()
+            return list(self._entries)
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from backend.app.core.metrics import ERRORS
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue has no free slots."""
+
+
+class FileProgress(BaseModel):
+    file_name: str
+    status: str = "queued"  # queued | running | completed | failed
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_embedded: int = 0
+    failures: List[str] = Field(default_factory=list)
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str = "queued"  # queued | running | completed | failed
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    files: List[FileProgress]
+
+
+class JobProgress:
+    """Progress reporter handed to the ingestion function for a single job."""
+
+    def __init__(self, job: JobStatus, file_paths: List[str], lock: threading.Lock):
+        self._lock = lock
+        self._files: Dict[str, FileProgress] = dict(zip(file_paths, job.files))
+
+    def _file(self, file_path: str) -> Optional[FileProgress]:
+        return self._files.get(file_path)
+
+    def file_started(self, file_path: str, pages_total: int = 0):
+        with self._lock:
+            progress = self._file(file_path)
+            if progress:
+                progress.status = "running"
+                progress.pages_total = pages_total
+
+    def page_parsed(self, file_path: str, count: int = 1):
+        with self._lock:
+            progress = self._file(file_path)
+            if progress:
+                progress.pages_parsed += count
+
+    def chunks_embedded(self, file_path: str, count: int):
+        with self._lock:
+            progress = self._file(file_path)
+            if progress:
+                progress.chunks_embedded += count
+
+    def file_failed(self, file_path: str, error: str):
+        with self._lock:
+            progress = self._file(file_path)
+            if progress:
+                progress.status = "failed"
+                progress.failures.append(error)
+
+    def file_completed(self, file_path: str):
+        with self._lock:
+            progress = self._file(file_path)
+            if progress and progress.status != "failed":
+                progress.status = "completed"
+
+
+class IngestionJobQueue:
+    """
+    Bounded background queue for document ingestion.
+
+    Jobs run on a fixed-size thread pool so parsing, OCR and embedding never block
+    the event loop. At most `max_pending` jobs may be queued or running at once;
+    `submit` raises QueueFullError beyond that so callers can apply backpressure.
+    """
+
+    def __init__(self, worker_count: int, max_pending: int, retention: int = 500):
+        self._executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="ingest")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, JobStatus]" = OrderedDict()
+        self._retention = retention
+
+    def submit(self, file_paths: List[str], ingest_fn: Callable[[List[str], JobProgress], None]) -> JobStatus:
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Ingestion queue is full")
+
+        job = JobStatus(
+            job_id=str(uuid.uuid4()),
+            created_at=time.time(),
+            files=[FileProgress(file_name=os.path.basename(p)) for p in file_paths],
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune_finished()
+
+        try:
+            self._executor.submit(self._run, job, file_paths, ingest_fn)
+        except Exception:
+            self._slots.release()
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy(deep=True) if job else None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: JobStatus, file_paths: List[str], ingest_fn):
+        progress = JobProgress(job, file_paths, self._lock)
+        with self._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        try:
+            ingest_fn(file_paths, progress)
+            with self._lock:
+                for file_progress in job.files:
+                    if file_progress.status in ("queued", "running"):
+                        file_progress.status = "completed"
+                all_failed = all(f.status == "failed" for f in job.files)
+                job.status = "failed" if all_failed else "completed"
+        except Exception as e:
+            logging.error(f"Ingestion job {job.job_id} failed: {e}", exc_info=True)
+            ERRORS.labels("ingest").inc()
+            with self._lock:
+                job.status = "failed"
+                job.error = str(e)
+        finally:
+            with self._lock:
+                job.finished_at = time.time()
+            self._slots.release()
+
+    def _prune_finished(self):
+        # Caller holds self._lock. Oldest finished jobs are dropped first.
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self._retention)]:
+            del self._jobs[job_id]
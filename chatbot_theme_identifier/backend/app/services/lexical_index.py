@@ -0,0 +1,171 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import logging
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+from backend.config import LEXICAL_MAX_DF_RATIO
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric tokens, so identifiers like `leph203` or `day28` stay intact."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index persisted in SQLite.
+
+    Postings are clustered by term (WITHOUT ROWID), document frequencies and corpus
+    statistics are maintained incrementally, and scoring runs as a single SQL
+    aggregation so only the matching chunks are touched. `source` and `page_number`
+    filters are applied inside that query.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY, source TEXT NOT NULL, page_number INTEGER NOT NULL, length INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_chunks_source_page ON chunks (source, page_number);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value REAL NOT NULL) WITHOUT ROWID;
+            INSERT OR IGNORE INTO stats VALUES ('n_chunks', 0), ('total_length', 0);
+        """)
+        self._conn.commit()
+
+    def _stats(self) -> Tuple[int, float]:
+        rows = dict(self._conn.execute("SELECT key, value FROM stats").fetchall())
+        return int(rows["n_chunks"]), rows["total_length"]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._stats()[0]
+
+    def add(self, chunks: Iterable[Tuple[str, str, str, int]]):
+        """Indexes (chunk_id, text, source, page_number) tuples; IDs already indexed are skipped."""
+        with self._lock:
+            added = 0
+            added_length = 0
+            for chunk_id, text, source, page_number in chunks:
+                tokens = tokenize(text)
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO chunks (id, source, page_number, length) VALUES (?, ?, ?, ?)",
+                    (chunk_id, source, page_number, len(tokens)),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                term_counts = Counter(tokens)
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in term_counts.items()],
+                )
+                self._conn.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in term_counts],
+                )
+                added += 1
+                added_length += len(tokens)
+            self._update_stats(added, added_length)
+            self._conn.commit()
+
+    def delete(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            removed = 0
+            removed_length = 0
+            for chunk_id in chunk_ids:
+                row = self._conn.execute("SELECT length FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+                if row is None:
+                    continue
+                terms = [(term,) for (term,) in self._conn.execute("SELECT term FROM postings WHERE chunk_id = ?", (chunk_id,))]
+                self._conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", terms)
+                self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+                self._conn.execute("DELETE FROM chunks WHERE id = ?", (chunk_id,))
+                removed += 1
+                removed_length += row[0]
+            if removed:
+                self._conn.execute("DELETE FROM terms WHERE df <= 0")
+            self._update_stats(-removed, -removed_length)
+            self._conn.commit()
+
+    def _update_stats(self, chunk_delta: int, length_delta: int):
+        if chunk_delta:
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'n_chunks'", (chunk_delta,))
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (length_delta,))
+
+    def search(self, query: str, k: int, source: Optional[str] = None, page_number: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Returns up to k (chunk_id, bm25_score) pairs, best first."""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            n_chunks, total_length = self._stats()
+            if n_chunks == 0:
+                return []
+            avg_length = total_length / n_chunks
+            placeholders = ",".join("?" * len(query_terms))
+            doc_freqs = dict(self._conn.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", query_terms))
+            if not doc_freqs:
+                return []
+
+            # Very common terms contribute almost nothing to BM25 but dominate the postings scan.
+            selective = {t: df for t, df in doc_freqs.items() if df / n_chunks <= LEXICAL_MAX_DF_RATIO}
+            doc_freqs = selective or doc_freqs
+
+            term_weights = []
+            for term, df in doc_freqs.items():
+                term_weights.extend((term, math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))))
+            values = ",".join(["(?, ?)"] * len(doc_freqs))
+
+            where = []
+            params = list(term_weights) + [BM25_K1 + 1, BM25_K1, BM25_B, BM25_B, avg_length]
+            if source is not None:
+                where.append("c.source = ?")
+                params.append(source)
+            if page_number is not None:
+                where.append("c.page_number = ?")
+                params.append(page_number)
+            params.append(k)
+
+            rows = self._conn.execute(
+                f"""
+                WITH q(term, idf) AS (VALUES {values})
+                SELECT p.chunk_id,
+                       SUM(q.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * c.length / ?))) AS score
+                FROM q
+                JOIN postings p ON p.term = q.term
+                JOIN chunks c ON c.id = p.chunk_id
+                {"WHERE " + " AND ".join(where) if where else ""}
+                GROUP BY p.chunk_id
+                ORDER BY score DESC
+                LIMIT ?
+                """,
+                params,
+            ).fetchall()
+        return [(chunk_id, score) for chunk_id, score in rows]
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript("""
+                DELETE FROM postings; DELETE FROM terms; DELETE FROM chunks;
+                UPDATE stats SET value = 0;
+            """)
+            self._conn.commit()
+        logging.info("Cleared lexical index")
@@ -0,0 +1,119 @@
+import asyncio
+import random
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from groq import AsyncGroq, APIConnectionError, InternalServerError, RateLimitError
+
+from backend.app.core.metrics import LLM_REQUESTS, record_llm_usage
+from backend.config import (
+    GROQ_API_KEY,
+    LLM_MODEL,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_TIMEOUT_SECONDS,
+)
+
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+_client: Optional[AsyncGroq] = None
+_limiter: Optional[asyncio.Semaphore] = None
+
+
+def get_llm_client() -> AsyncGroq:
+    """Shared AsyncGroq client backed by a pooled keep-alive HTTP connection pool."""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=LLM_TIMEOUT_SECONDS,
+        )
+        # Retries are handled below so they also respect the global concurrency limit.
+        _client = AsyncGroq(api_key=GROQ_API_KEY, http_client=http_client, max_retries=0)
+    return _client
+
+
+def get_llm_limiter() -> asyncio.Semaphore:
+    global _limiter
+    if _limiter is None:
+        _limiter = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _limiter
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return LLM_RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random())
+
+
+async def create_chat_completion(messages: List[Dict[str, str]], model: str = LLM_MODEL, **kwargs: Any):
+    """
+    Issues a chat completion through the shared client.
+
+    At most LLM_MAX_CONCURRENCY completions run at once process-wide. Rate-limit,
+    5xx and connection errors are retried with exponential backoff (honouring
+    Retry-After); the limiter slot is released while waiting so other requests proceed.
+    """
+    client = get_llm_client()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with get_llm_limiter():
+                completion = await client.chat.completions.create(messages=messages, model=model, **kwargs)
+            LLM_REQUESTS.labels(model, "ok").inc()
+            record_llm_usage(model, completion.usage)
+            return completion
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                LLM_REQUESTS.labels(model, "error").inc()
+                raise
+            LLM_REQUESTS.labels(model, "retry").inc()
+            delay = _retry_delay(e, attempt)
+            logging.warning(f"Groq call failed ({type(e).__name__}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def stream_chat_completion(messages: List[Dict[str, str]], model: str = LLM_MODEL, **kwargs: Any) -> AsyncIterator[str]:
+    """
+    Streams the content deltas of a chat completion.
+
+    Holds a limiter slot for the life of the stream. Opening the stream is retried
+    like create_chat_completion; errors after the first token are raised to the caller.
+    """
+    client = get_llm_client()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        async with get_llm_limiter():
+            try:
+                stream = await client.chat.completions.create(messages=messages, model=model, stream=True, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt == LLM_MAX_RETRIES:
+                    LLM_REQUESTS.labels(model, "error").inc()
+                    raise
+                LLM_REQUESTS.labels(model, "retry").inc()
+                delay = _retry_delay(e, attempt)
+            else:
+                async for chunk in stream:
+                    # Groq reports token usage on the final chunk under `x_groq`.
+                    x_groq = getattr(chunk, "x_groq", None)
+                    record_llm_usage(model, getattr(x_groq, "usage", None))
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+                LLM_REQUESTS.labels(model, "ok").inc()
+                return
+        logging.warning(f"Groq stream failed to open, retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+async def close_llm_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
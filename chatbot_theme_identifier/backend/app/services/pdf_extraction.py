@@ -0,0 +1,199 @@
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+from backend.app.core.metrics import ERRORS, OCR_PAGES, PAGES_PARSED
+from backend.app.core.timing import record_stage
+from backend.app.services.document_processing import paragraph_document
+from backend.config import PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK, OCR_MAX_WORKERS, OCR_DPI
+
+Block = Tuple  # PyMuPDF text block: (x0, y0, x1, y1, text, block_no, block_type)
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_ocr_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pools() -> Tuple[ProcessPoolExecutor, ProcessPoolExecutor]:
+    """Lazily starts the parse and OCR process pools (spawned, so they are safe next to uvicorn threads)."""
+    global _parse_pool, _ocr_pool
+    with _pool_lock:
+        if _parse_pool is None:
+            context = multiprocessing.get_context("spawn")
+            _parse_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=context)
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS, mp_context=context)
+            logging.info(f"Started PDF extraction pools: {PDF_EXTRACT_WORKERS} parse workers, {OCR_MAX_WORKERS} OCR workers")
+    return _parse_pool, _ocr_pool
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    """The OCR pool, shared with image extraction so Tesseract concurrency stays capped at OCR_MAX_WORKERS."""
+    return _get_pools()[1]
+
+
+def shutdown_pools():
+    global _parse_pool, _ocr_pool
+    with _pool_lock:
+        for pool in (_parse_pool, _ocr_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = _ocr_pool = None
+
+
+def _parse_page_range(file_path: str, start: int, end: int) -> Tuple[List[Tuple[int, Optional[List[Block]]]], float]:
+    """
+    Runs in a parse worker. Returns (page_index, blocks) per page, where blocks is None for
+    scanned pages needing OCR, plus the seconds spent (stage timings live in the parent).
+    """
+    import fitz
+
+    started = time.perf_counter()
+    results = []
+    with fitz.open(file_path) as doc:
+        for page_num in range(start, end):
+            page = doc.load_page(page_num)
+            if not page.get_text("text").strip() and len(page.get_images()) > 0:
+                results.append((page_num, None))
+            else:
+                results.append((page_num, [tuple(block) for block in page.get_text("blocks")]))
+    return results, time.perf_counter() - started
+
+
+def ocr_text_blocks(text: str) -> List[Block]:
+    """One pseudo-block per blank-line separated paragraph of Tesseract output."""
+    return [(0.0, 0.0, 0.0, 0.0, para_text.strip(), 0, 0) for para_text in text.split('\n\n') if para_text.strip()]
+
+
+def _ocr_page(file_path: str, page_num: int, dpi: int) -> Tuple[List[Block], float]:
+    """Runs in an OCR worker. Renders a single page at `dpi`; returns one pseudo-block per OCR paragraph and the seconds spent."""
+    import fitz
+    import pytesseract
+    from PIL import Image
+
+    started = time.perf_counter()
+    with fitz.open(file_path) as doc:
+        pix = doc.load_page(page_num).get_pixmap(dpi=dpi)
+    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    return ocr_text_blocks(pytesseract.image_to_string(img)), time.perf_counter() - started
+
+
+def is_potential_paragraph_start(block):
+    x0 = block[0]
+    return x0 > 50
+
+
+def page_paragraphs(source: str, page_num: int, blocks: List[Block]) -> List[Document]:
+    """
+    Groups the text blocks of one page into paragraph Documents.
+
+    A block whose x0 is indented past 50pt starts a new paragraph; the paragraph still
+    open at the end of the page is emitted with that page.
+    """
+    documents = []
+    current_paragraph = ""
+    current_paragraph_blocks = []
+
+    def emit():
+        start = current_paragraph_blocks[0][0] if isinstance(current_paragraph_blocks[0][0], (int, float)) else 0.0
+        end = current_paragraph_blocks[-1][2] if isinstance(current_paragraph_blocks[-1][2], (int, float)) else 0.0
+        documents.append(paragraph_document(source, page_num, current_paragraph, start, end))
+
+    for block in blocks:
+        text_content = block[4].strip()
+        if not text_content:
+            continue
+
+        is_new_paragraph_start = False
+        if len(block) > 4 and isinstance(block[0], (int, float)):
+            is_new_paragraph_start = is_potential_paragraph_start(block)
+
+        if is_new_paragraph_start and current_paragraph:
+            emit()
+            current_paragraph = text_content
+            current_paragraph_blocks = [block]
+        else:
+            if not current_paragraph:
+                current_paragraph = text_content
+            else:
+                current_paragraph += " " + text_content
+            current_paragraph_blocks.append(block)
+
+    if current_paragraph:
+        emit()
+    return documents
+
+
+def iter_pdf_paragraphs(file_path: str, source: str, progress=None) -> Iterator[Document]:
+    """
+    Yields the paragraph Documents of one PDF lazily, in page order.
+
+    The file is split into page ranges of PDF_PAGES_PER_TASK pages, and at most
+    2 * PDF_EXTRACT_WORKERS ranges are in flight on the parse pool at a time, so memory
+    stays bounded however long the document is. Pages without a text layer are queued
+    on the OCR pool as soon as their range is parsed, reading ahead while OCR is the
+    bottleneck. Raises if the file cannot be opened or a range fails to parse.
+    """
+    import fitz  # Deferred with the other PDF/OCR libraries so importing this module stays cheap
+
+    parse_pool, ocr_pool = _get_pools()
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+    if progress:
+        progress.file_started(source, page_count)
+
+    ranges = iter(range(0, page_count, PDF_PAGES_PER_TASK))
+    parsing: Deque[Future] = deque()
+    pages: Deque[Tuple[int, Union[List[Block], Future]]] = deque()
+    ocr_backlog = 0
+
+    def fill():
+        for start in ranges:
+            parsing.append(parse_pool.submit(_parse_page_range, file_path, start, min(start + PDF_PAGES_PER_TASK, page_count)))
+            if len(parsing) >= 2 * PDF_EXTRACT_WORKERS:
+                break
+
+    try:
+        fill()
+        while parsing or pages:
+            # Take parsed ranges until there is a page to emit, then keep reading ahead
+            # over finished ranges while the OCR pool has room for their scanned pages.
+            while parsing and (not pages or (parsing[0].done() and ocr_backlog < 2 * OCR_MAX_WORKERS)):
+                page_results, elapsed = parsing.popleft().result()
+                record_stage("parse", elapsed)
+                fill()
+                for page_num, blocks in page_results:
+                    if blocks is None:
+                        logging.info(f"Page {page_num + 1} of {source} appears scanned. Attempting OCR.")
+                        blocks = ocr_pool.submit(_ocr_page, file_path, page_num, OCR_DPI)
+                        ocr_backlog += 1
+                    pages.append((page_num, blocks))
+
+            page_num, blocks = pages.popleft()
+            if isinstance(blocks, Future):
+                ocr_backlog -= 1
+                try:
+                    blocks, elapsed = blocks.result()
+                    record_stage("ocr", elapsed)
+                    OCR_PAGES.inc()
+                except Exception as ocr_e:
+                    logging.error(f"Error during OCR for page {page_num + 1} of {source}: {ocr_e}")
+                    ERRORS.labels("ocr").inc()
+                    blocks = []
+            else:
+                PAGES_PARSED.inc()
+            if progress:
+                progress.page_parsed(source)
+            yield from page_paragraphs(source, page_num, blocks)
+    finally:
+        # Closed early or failed: drop the work nobody will read.
+        for future in parsing:
+            future.cancel()
+        for _, blocks in pages:
+            if isinstance(blocks, Future):
+                blocks.cancel()
@@ -0,0 +1,112 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used for cache keys."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class QueryResponseCache:
+    """
+    In-memory TTL + LRU cache for /query/ responses with single-flight coalescing.
+
+    Keys include the corpus version, so every ingestion implicitly invalidates older
+    answers. Concurrent requests for the same key share one computation, which runs
+    as a task of its own that every caller awaits.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(query: str, output_format, k: int, corpus_version: int, **filters) -> Hashable:
+        return (normalize_query(query), output_format, k, corpus_version, tuple(sorted(filters.items())))
+
+    def _lookup(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            self._evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def get(self, key: Hashable) -> Any:
+        """Returns a cached value (counted as a hit) or None; misses are not counted."""
+        value = self._lookup(key)
+        if value is not None:
+            self._hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self._store(key, value)
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]],
+                             cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Returns the cached value for `key`, or awaits a shared computation of it.
+
+        The computation runs as its own task rather than inside the first caller, so a
+        caller that is cancelled (client disconnect) does not cancel it for the others.
+        Results for which `cacheable` is false (degraded responses) are returned but not stored.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            self._hits += 1
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._coalesced += 1
+        else:
+            self._misses += 1
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done, cacheable))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future, cacheable: Callable[[Any], bool]):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled():
+            return
+        if task.exception() is None and cacheable(task.result()):  # exception() also marks a failure as retrieved
+            self._store(key, task.result())
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses + self._coalesced
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "evictions": self._evictions,
+            "hit_rate": (self._hits + self._coalesced) / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
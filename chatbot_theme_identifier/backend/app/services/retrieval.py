@@ -0,0 +1,85 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from backend.config import HYBRID_CANDIDATE_MULTIPLIER, RRF_K
+from backend.app.core.timing import stage
+from backend.app.services.ingest_manifest import chunk_id
+from backend.app.services.lexical_index import LexicalIndex
+
+BACKFILL_PAGE_SIZE = 1000
+
+
+def chroma_filter(source: Optional[str] = None, page_number: Optional[int] = None) -> Optional[Dict]:
+    """Builds the Chroma `where` clause for the optional metadata filters."""
+    clauses = []
+    if source is not None:
+        clauses.append({"source": source})
+    if page_number is not None:
+        clauses.append({"page_number": page_number})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[str]], rrf_k: int = RRF_K) -> List[str]:
+    """Fuses ranked ID lists: each list contributes 1 / (rrf_k + rank) to an ID's score."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranked_ids in ranked_lists:
+        for rank, item_id in enumerate(ranked_ids, start=1):
+            scores[item_id] += 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _doc_chunk_id(doc: Document) -> str:
+    # Chunks ingested before deterministic IDs have no chunk_id in their metadata; fall back to the Chroma ID.
+    return (doc.metadata.get('chunk_id') or getattr(doc, "id", None)
+            or chunk_id(doc.metadata.get('source', ''), doc.metadata.get('page_number', 0), doc.page_content))
+
+
+class HybridRetriever:
+    """
+    Dense (Chroma) + lexical (BM25) retrieval merged with reciprocal rank fusion.
+
+    Both retrievers receive the metadata filters, so filtering happens inside each
+    index rather than on the fused results.
+    """
+
+    def __init__(self, db, lexical_index: LexicalIndex):
+        self.db = db
+        self.lexical_index = lexical_index
+
+    def search(self, query: str, k: int = 5, source: Optional[str] = None, page_number: Optional[int] = None) -> List[Document]:
+        candidates = k * HYBRID_CANDIDATE_MULTIPLIER
+        with stage("search"):
+            dense_docs = self.db.similarity_search(query, k=candidates, filter=chroma_filter(source, page_number))
+        with stage("lexical_search"):
+            lexical_hits = self.lexical_index.search(query, candidates, source=source, page_number=page_number)
+
+        docs_by_id = {_doc_chunk_id(doc): doc for doc in dense_docs}
+        fused_ids = reciprocal_rank_fusion([list(docs_by_id), [hit_id for hit_id, _ in lexical_hits]])[:k]
+
+        missing_ids = [i for i in fused_ids if i not in docs_by_id]
+        if missing_ids:
+            fetched = self.db.get(ids=missing_ids, include=["documents", "metadatas"])
+            for fetched_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                docs_by_id[fetched_id] = Document(page_content=text, metadata=metadata or {})
+
+        return [docs_by_id[i] for i in fused_ids if i in docs_by_id]
+
+
+def backfill_lexical_index(db, lexical_index: LexicalIndex):
+    """Indexes every chunk already stored in Chroma; used once when the lexical index is new."""
+    offset = 0
+    while True:
+        page = db.get(include=["documents", "metadatas"], limit=BACKFILL_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        lexical_index.add(
+            (chunk_id_, text, (metadata or {}).get('source', ''), (metadata or {}).get('page_number', 0))
+            for chunk_id_, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        )
+        offset += len(page["ids"])
+    logging.info(f"Backfilled lexical index with {offset} chunks from ChromaDB")
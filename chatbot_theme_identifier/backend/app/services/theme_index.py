@@ -0,0 +1,320 @@
+# Corpus-wide theme index. Rebuild with:
+#   python -m backend.app.services.theme_index build [--clusters N]
+import argparse
+import asyncio
+import json
+import os
+import threading
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from backend.config import THEME_INDEX_PATH, THEME_CLUSTERS, THEME_MEMBER_CITATIONS, CHROMA_PERSIST_DIRECTORY
+
+CHROMA_PAGE_SIZE = 5000
+LABEL_SAMPLE_SIZE = 8
+LABEL_SNIPPET_CHARS = 500
+CITATION_SNIPPET_CHARS = 300
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _kmeans_plus_plus(X: np.ndarray, n_clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = [X[rng.integers(len(X))]]
+    closest = 1.0 - X @ centroids[0]
+    for _ in range(1, n_clusters):
+        weights = np.maximum(closest, 0) ** 2
+        total = weights.sum()
+        index = rng.choice(len(X), p=weights / total) if total > 0 else rng.integers(len(X))
+        centroids.append(X[index])
+        closest = np.minimum(closest, 1.0 - X @ X[index])
+    return np.stack(centroids)
+
+
+def assign_clusters(X: np.ndarray, centroids: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+    """Index of the most similar centroid for every row of X (rows and centroids unit-normalized)."""
+    labels = np.empty(len(X), dtype=np.int64)
+    for start in range(0, len(X), batch_size):
+        labels[start:start + batch_size] = np.argmax(X[start:start + batch_size] @ centroids.T, axis=1)
+    return labels
+
+
+def minibatch_kmeans(X: np.ndarray, n_clusters: int, batch_size: int = 1024, iterations: int = 100, seed: int = 0):
+    """
+    Spherical mini-batch k-means (Sculley, 2010) on unit vectors.
+
+    Returns (centroids, labels, counts). Each iteration assigns one random batch and moves
+    every centroid towards its batch mean with a per-centroid learning rate of 1 / count.
+    """
+    rng = np.random.default_rng(seed)
+    sample = X[rng.choice(len(X), min(len(X), 10_000), replace=False)]
+    centroids = _kmeans_plus_plus(sample, n_clusters, rng)
+    counts = np.zeros(n_clusters)
+
+    for _ in range(iterations):
+        batch = X[rng.choice(len(X), min(batch_size, len(X)), replace=False)]
+        batch_labels = np.argmax(batch @ centroids.T, axis=1)
+        batch_counts = np.bincount(batch_labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, batch_labels, batch)
+        counts += batch_counts
+        moved = batch_counts > 0
+        centroids[moved] += (sums[moved] - batch_counts[moved, None] * centroids[moved]) / counts[moved, None]
+        centroids = _normalize(centroids)
+
+    labels = assign_clusters(X, centroids)
+    return centroids, labels, np.bincount(labels, minlength=n_clusters)
+
+
+def _citation(chunk_id: str, text: str, metadata: Dict) -> Dict:
+    return {
+        "chunk_id": chunk_id,
+        "source": metadata.get('source', 'unknown'),
+        "page_number": metadata.get('page_number', 1),
+        "paragraph_start": metadata.get('paragraph_start', 0.0),
+        "paragraph_end": metadata.get('paragraph_end', 0.0),
+        "snippet_text": text[:CITATION_SNIPPET_CHARS],
+    }
+
+
+class ThemeIndex:
+    """
+    Corpus-wide themes: one centroid per cluster of chunk embeddings, labelled once by the LLM.
+
+    Persisted as `<path>.npz` (centroids, counts, chunk memberships) and `<path>.json`
+    (theme names, descriptions and representative citations). New chunks are folded into
+    their nearest cluster as they are ingested; a full rebuild re-clusters the corpus.
+    """
+
+    def __init__(self, path: str = THEME_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._loaded_mtime: Optional[float] = None
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.member_labels: Dict[str, int] = {}
+        self.themes: List[Dict] = []
+        self.reload_if_changed()
+
+    @property
+    def _json_path(self) -> str:
+        return f"{self.path}.json"
+
+    @property
+    def _npz_path(self) -> str:
+        return f"{self.path}.npz"
+
+    def __len__(self) -> int:
+        return len(self.themes)
+
+    def reload_if_changed(self):
+        """Picks up an index rebuilt by the CLI (or another worker) since it was last loaded."""
+        try:
+            mtime = os.path.getmtime(self._json_path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            try:
+                with open(self._json_path, "r", encoding="utf-8") as f:
+                    themes = json.load(f)["themes"]
+                with np.load(self._npz_path) as arrays:
+                    centroids = arrays["centroids"]
+                    counts = arrays["counts"]
+                    member_labels = dict(zip(arrays["member_ids"].tolist(), arrays["member_labels"].tolist()))
+            except (OSError, KeyError, ValueError) as e:
+                logging.error(f"Could not load theme index {self.path}: {e}")
+                return
+            self.themes, self.centroids, self.counts, self.member_labels = themes, centroids, counts, member_labels
+            self._loaded_mtime = mtime
+            logging.info(f"Loaded theme index with {len(themes)} themes over {len(member_labels)} chunks")
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            member_ids = list(self.member_labels)
+            np.savez(
+                f"{self.path}.tmp.npz",
+                centroids=self.centroids.astype(np.float32),
+                counts=self.counts,
+                member_ids=np.array(member_ids, dtype=str),
+                member_labels=np.array([self.member_labels[i] for i in member_ids], dtype=np.int64),
+            )
+            os.replace(f"{self.path}.tmp.npz", self._npz_path)
+            with open(f"{self._json_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"themes": self.themes}, f)
+            os.replace(f"{self._json_path}.tmp", self._json_path)
+            self._loaded_mtime = os.path.getmtime(self._json_path)
+
+    def nearest_themes(self, vectors: Sequence[Sequence[float]]) -> List[int]:
+        """Cluster index of the nearest centroid for each vector."""
+        X = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            return assign_clusters(X, self.centroids).tolist()
+
+    def add_chunks(self, chunk_ids: List[str], vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[Dict]):
+        """Folds new chunks into their nearest clusters, moving each centroid by a running mean."""
+        if not len(self) or not chunk_ids:
+            return
+        X = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            labels = assign_clusters(X, self.centroids)
+            for chunk_id, vector, text, metadata, label in zip(chunk_ids, X, texts, metadatas, labels):
+                if chunk_id in self.member_labels:
+                    continue
+                self.member_labels[chunk_id] = int(label)
+                self.counts[label] += 1
+                centroid = self.centroids[label] + (vector - self.centroids[label]) / self.counts[label]
+                self.centroids[label] = centroid / max(np.linalg.norm(centroid), 1e-12)
+                citations = self.themes[label]["citations"]
+                if len(citations) < THEME_MEMBER_CITATIONS:
+                    citations.append(_citation(chunk_id, text, metadata))
+
+    def members(self, chunk_ids: List[str]) -> List[str]:
+        """The chunks among `chunk_ids` that belong to a cluster."""
+        with self._lock:
+            return [chunk_id for chunk_id in chunk_ids if chunk_id in self.member_labels]
+
+    def remove_chunks(self, chunk_ids: List[str], vectors: Optional[Dict[str, Sequence[float]]] = None):
+        """
+        Drops chunks from their clusters. With the chunks' `vectors` (by chunk ID) each
+        centroid is moved back by the inverse of the running-mean update in add_chunks;
+        chunks without a vector only leave the counts and citations.
+        """
+        vectors = vectors or {}
+        with self._lock:
+            for chunk_id in chunk_ids:
+                label = self.member_labels.pop(chunk_id, None)
+                if label is None:
+                    continue
+                vector = vectors.get(chunk_id)
+                if vector is not None and self.counts[label] > 1:
+                    vector = _normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+                    centroid = self.centroids[label] + (self.centroids[label] - vector) / (self.counts[label] - 1)
+                    self.centroids[label] = centroid / max(np.linalg.norm(centroid), 1e-12)
+                self.counts[label] = max(0, self.counts[label] - 1)
+                theme = self.themes[label]
+                theme["citations"] = [c for c in theme["citations"] if c["chunk_id"] != chunk_id]
+
+    def summary(self) -> List[Dict]:
+        with self._lock:
+            return [dict(theme, size=int(self.counts[i])) for i, theme in enumerate(self.themes)]
+
+
+def _load_corpus(db):
+    """Pages every chunk's ID, embedding and metadata out of Chroma."""
+    ids, vectors, metadatas = [], [], []
+    offset = 0
+    while True:
+        page = db.get(include=["embeddings", "metadatas"], limit=CHROMA_PAGE_SIZE, offset=offset)
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        metadatas.extend(m or {} for m in page["metadatas"])
+        offset += len(page["ids"])
+    return ids, (np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)), metadatas
+
+
+async def _label_cluster(snippets: List[str]) -> Dict[str, str]:
+    from backend.app.services.llm_client import create_chat_completion
+
+    context = "\n\n".join(f"Snippet: {snippet[:LABEL_SNIPPET_CHARS]}" for snippet in snippets)
+    prompt = f"""
+    The following text snippets were grouped together because they discuss a common theme.
+    Give that theme a concise 'theme_name' and a one-sentence 'theme_description'.
+
+    **Output a JSON object with exactly the keys "theme_name" and "theme_description".**
+    Do NOT include any other text, preamble, or markdown outside the JSON.
+
+    {context}
+    """
+    try:
+        completion = await create_chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+        )
+        label = json.loads(completion.choices[0].message.content)
+        return {"theme_name": label.get("theme_name", "Unnamed Theme"), "theme_description": label.get("theme_description")}
+    except Exception as e:
+        logging.error(f"Error labelling theme cluster: {e}", exc_info=True)
+        return {"theme_name": "Unnamed Theme", "theme_description": None}
+
+
+async def build_theme_index(db, path: str = THEME_INDEX_PATH, n_clusters: int = THEME_CLUSTERS) -> ThemeIndex:
+    """Clusters every chunk in `db`, labels each cluster once with the LLM and persists the result."""
+    ids, vectors, metadatas = _load_corpus(db)
+    if len(ids) < 2:
+        raise ValueError("Need at least two stored chunks to build a theme index")
+    X = _normalize(vectors)
+    if n_clusters <= 0:
+        n_clusters = int(np.clip(np.sqrt(len(ids) / 2), 2, 64))
+    n_clusters = min(n_clusters, len(ids))
+
+    centroids, labels, counts = minibatch_kmeans(X, n_clusters)
+    logging.info(f"Clustered {len(ids)} chunks into {n_clusters} themes")
+
+    similarity = np.einsum("ij,ij->i", X, centroids[labels])
+    representatives = []
+    for cluster in range(n_clusters):
+        members = np.flatnonzero(labels == cluster)
+        closest = members[np.argsort(-similarity[members])][:max(LABEL_SAMPLE_SIZE, THEME_MEMBER_CITATIONS)]
+        representatives.append([ids[i] for i in closest])
+
+    texts_by_id = {}
+    wanted = [chunk_id for group in representatives for chunk_id in group]
+    for start in range(0, len(wanted), CHROMA_PAGE_SIZE):
+        fetched = db.get(ids=wanted[start:start + CHROMA_PAGE_SIZE], include=["documents"])
+        texts_by_id.update(zip(fetched["ids"], fetched["documents"]))
+    metadata_by_id = dict(zip(ids, metadatas))
+
+    labels_from_llm = await asyncio.gather(*(
+        _label_cluster([texts_by_id.get(chunk_id, "") for chunk_id in group[:LABEL_SAMPLE_SIZE]])
+        for group in representatives
+    ))
+
+    index = ThemeIndex(path)
+    index.centroids = centroids.astype(np.float32)
+    index.counts = counts.astype(np.int64)
+    index.member_labels = dict(zip(ids, labels.tolist()))
+    index.themes = [
+        dict(label, citations=[
+            _citation(chunk_id, texts_by_id.get(chunk_id, ""), metadata_by_id[chunk_id])
+            for chunk_id in group[:THEME_MEMBER_CITATIONS]
+        ])
+        for label, group in zip(labels_from_llm, representatives)
+    ]
+    index.save()
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the corpus-wide theme index from the chunks stored in ChromaDB.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--clusters", type=int, default=THEME_CLUSTERS, help="Number of themes (0 = automatic)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from backend.app.core.database import ShardedVectorStore
+    from backend.app.services.llm_client import close_llm_client
+
+    async def run():
+        try:
+            # Clustering reads the stored vectors, so no embedding model is needed.
+            db = ShardedVectorStore(embedding_function=None, persist_directory=CHROMA_PERSIST_DIRECTORY)
+            index = await build_theme_index(db, n_clusters=args.clusters)
+            for theme in index.summary():
+                print(f"{theme['size']:>7}  {theme['theme_name']}: {theme['theme_description']}")
+        finally:
+            await close_llm_client()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import tempfile
+import threading
+import logging
+from typing import BinaryIO, Dict, NamedTuple, Set
+
+from backend.config import UPLOAD_STORE_DIR, UPLOAD_CHUNK_BYTES, UPLOAD_MAX_BYTES
+
+UPLOAD_SOURCE_DIR = "backend/data/temp"  # Logical source prefix of uploads, as stored in chunk metadata and the manifest
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+
+class StoredUpload(NamedTuple):
+    source: str  # Logical source the upload is ingested and cited as
+    path: str  # Content-addressed file holding its bytes
+    sha256: str
+    size: int
+    deduplicated: bool  # True if identical bytes were already stored
+
+
+def upload_source(filename: str) -> str:
+    """Logical source for an uploaded file name; directory components are dropped."""
+    return f"{UPLOAD_SOURCE_DIR}/{os.path.basename(filename or 'upload')}"
+
+
+class UploadStore:
+    """
+    Content-addressed storage for uploaded files.
+
+    Uploads are copied to a temporary file in `chunk_size` blocks while being hashed,
+    so memory use is constant in the file size, then renamed to
+    `<root>/<sha[:2]>/<sha>.<ext>`. Identical bytes are stored once, and a concurrent
+    upload can never overwrite a file another job is reading.
+
+    Each stored file is held by the requests that stored it until they `claim` it (its
+    ingestion job was queued) or `discard` it (the request was rejected). A new file
+    that no job has claimed is deleted when the last request holding it discards it,
+    so a rejected request never removes bytes another request is about to queue.
+    """
+
+    def __init__(self, root: str = UPLOAD_STORE_DIR, chunk_size: int = UPLOAD_CHUNK_BYTES, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._holders: Dict[str, int] = {}  # Stored path -> requests holding it
+        self._unclaimed: Set[str] = set()  # Paths written by a request that no job has claimed yet
+        os.makedirs(os.path.join(root, "incoming"), exist_ok=True)
+
+    def store(self, stream: BinaryIO, filename: str) -> StoredUpload:
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "incoming"))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for block in iter(lambda: stream.read(self.chunk_size), b""):
+                    size += len(block)
+                    if size > self.max_bytes:
+                        raise UploadTooLargeError(f"{filename} exceeds the {self.max_bytes} byte upload limit")
+                    digest.update(block)
+                    out.write(block)
+
+            sha256 = digest.hexdigest()
+            extension = os.path.splitext(filename or "")[1].lower()
+            path = os.path.join(self.root, sha256[:2], f"{sha256}{extension}")
+            with self._lock:
+                deduplicated = os.path.exists(path)
+                if deduplicated:
+                    os.remove(tmp_path)
+                    logging.info(f"Upload {filename} matches stored content {path}")
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                    self._unclaimed.add(path)
+                self._holders[path] = self._holders.get(path, 0) + 1
+            return StoredUpload(upload_source(filename), path, sha256, size, deduplicated)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _release(self, path: str) -> int:
+        remaining = self._holders.get(path, 1) - 1
+        if remaining:
+            self._holders[path] = remaining
+        else:
+            self._holders.pop(path, None)
+        return remaining
+
+    def claim(self, stored: StoredUpload):
+        """Marks a stored file as queued for ingestion; it is never discarded after that."""
+        with self._lock:
+            self._release(stored.path)
+            self._unclaimed.discard(stored.path)
+
+    def discard(self, stored: StoredUpload):
+        """Releases a file this request will not ingest, deleting it if no other request holds it and no job has claimed it."""
+        with self._lock:
+            if self._release(stored.path) or stored.path not in self._unclaimed:
+                return
+            self._unclaimed.discard(stored.path)
+            if os.path.exists(stored.path):
+                os.remove(stored.path)
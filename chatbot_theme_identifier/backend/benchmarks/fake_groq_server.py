@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Tunable by run_benchmark.py (or the CLI below) before the server starts.
+settings = {
+    "latency_ms": 300.0,  # Time to first token / full response for non-streaming calls
+    "tokens_per_second": 200.0,  # Streaming rate after the first token
+    "answer_tokens": 120,
+}
+
+app = FastAPI()
+
+DOC_ID_PATTERN = re.compile(r"DOC\d{3}")
+
+
+def _completion_content(body: dict) -> str:
+    """Deterministic, well-formed content shaped like what the prompts in main.py ask for."""
+    prompt = body["messages"][-1]["content"]
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        if "document_ids" in prompt:
+            doc_ids = sorted(set(DOC_ID_PATTERN.findall(prompt)))
+            return json.dumps({"themes": [
+                {"theme_name": "Benchmark Theme A", "theme_description": "Synthetic theme.", "document_ids": doc_ids[::2]},
+                {"theme_name": "Benchmark Theme B", "theme_description": "Synthetic theme.", "document_ids": doc_ids[1::2]},
+            ]})
+        return json.dumps({"theme_name": "Benchmark Cluster", "theme_description": "Synthetic cluster label."})
+    return " ".join(f"token{i}" for i in range(settings["answer_tokens"]))
+
+
+def _usage(body: dict, content: str) -> dict:
+    prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    content = _completion_content(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    await asyncio.sleep(settings["latency_ms"] / 1000)
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(body, content),
+        }
+
+    async def events():
+        delay = 1.0 / settings["tokens_per_second"]
+        for i, token in enumerate(content.split(" ")):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": token if i == 0 else " " + token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(delay)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body["model"],
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"usage": _usage(body, content)},
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local Groq-compatible chat completions server with tunable latency.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"])
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"])
+    args = parser.parse_args()
+    settings.update(latency_ms=args.latency_ms, tokens_per_second=args.tokens_per_second)
+    print(f"Point the backend at it with GROQ_BASE_URL=http://127.0.0.1:{args.port}")
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
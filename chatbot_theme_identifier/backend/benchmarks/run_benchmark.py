@@ -0,0 +1,293 @@
+"""
+End-to-end ingest + query benchmark against a local Groq stand-in.
+
+Run from the chatbot_theme_identifier directory:
+
+    python -m backend.benchmarks.run_benchmark --concurrency 8 --repeat 3
+    python -m backend.benchmarks.run_benchmark --compare backend/benchmarks/results/<baseline>.json
+
+All state (Chroma, manifest, caches, indexes, uploads, profiles) goes to a fresh work directory, so the
+real backend/data stores are never touched. Results are written as JSON.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+FAKE_GROQ_PORT = 8900
+APP_PORT = 8901
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "total": sum(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def _child_pids():
+    pids = set()
+    for children in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        try:
+            with open(children, "r") as f:
+                pids.update(int(pid) for pid in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _peak_rss_kib(pid):
+    """VmHWM (peak resident set) of a live process, in KiB; None if it has exited."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """
+    Peak RSS of this process and of its live children, i.e. the extraction/OCR pool workers,
+    which stay up for the whole run. Read from /proc while they are alive: RUSAGE_CHILDREN
+    only counts children that have exited and been waited on. Call it before starting any
+    other subprocess.
+    """
+    worker_peaks = [kib for kib in map(_peak_rss_kib, _child_pids()) if kib is not None]
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # ru_maxrss is in KiB on Linux
+        "workers": len(worker_peaks),
+        "largest_worker": max(worker_peaks, default=0) / 1024,
+        "workers_total": sum(worker_peaks) / 1024,
+    }
+
+
+def start_server(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def configure_environment(work_dir, args):
+    """Points every persistent store at `work_dir` and the Groq client at the fake server. Must run before backend imports."""
+    os.environ.update({
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(work_dir, "chroma_db"),
+        "INGEST_MANIFEST_PATH": os.path.join(work_dir, "ingest_manifest.json"),
+        "EMBEDDING_CACHE_PATH": os.path.join(work_dir, "embedding_cache.sqlite"),
+        "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical_index.sqlite"),
+        "THEME_INDEX_PATH": os.path.join(work_dir, "theme_index"),
+        "UPLOAD_STORE_DIR": os.path.join(work_dir, "uploads"),
+        "PROFILE_OUTPUT_DIR": os.path.join(work_dir, "profiles"),
+        "GROQ_BASE_URL": f"http://127.0.0.1:{FAKE_GROQ_PORT}",
+        "GROQ_API_KEY": "benchmark",
+    })
+    if args.no_query_cache:
+        os.environ["QUERY_CACHE_MAX_ENTRIES"] = "0"
+
+
+def collect_files(data_dir, exclude_dirs=()):
+    """PDFs under `data_dir`, skipping the Chroma store and `exclude_dirs`, whose contents differ between machines."""
+    excluded = tuple(os.path.abspath(directory) + os.sep for directory in exclude_dirs)
+    files = sorted(
+        path for path in glob.glob(os.path.join(data_dir, "**", "*.pdf"), recursive=True)
+        if "chroma_db" not in path and not os.path.abspath(path).startswith(excluded)
+    )
+    return files
+
+
+async def drive_queries(queries, concurrency, repeat, stream):
+    import httpx
+
+    url = f"http://127.0.0.1:{APP_PORT}/query/stream" if stream else f"http://127.0.0.1:{APP_PORT}/query/"
+    latencies, first_byte, errors = [], [], 0
+    limiter = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=300, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(body):
+            nonlocal errors
+            async with limiter:
+                started = time.perf_counter()
+                try:
+                    async with client.stream("POST", url, json=body) as response:
+                        response.raise_for_status()
+                        first = None
+                        async for _ in response.aiter_raw():
+                            if first is None:
+                                first = time.perf_counter() - started
+                    first_byte.append(first or 0.0)
+                    latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors += 1
+                    print(f"Query failed: {body['query']!r}: {e}", file=sys.stderr)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(body) for _ in range(repeat) for body in queries))
+        wall = time.perf_counter() - started
+
+    return {
+        "endpoint": url.rsplit(str(APP_PORT), 1)[1],
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "latency": percentiles(latencies),
+        "time_to_first_byte": percentiles(first_byte),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Prints p95 deltas against a baseline run; returns the names of regressed metrics."""
+    rows = [("query latency", current["query"]["latency"], baseline["query"]["latency"]),
+            ("ingest wall", {"p95": current["ingest"]["wall_seconds"]}, {"p95": baseline["ingest"]["wall_seconds"]})]
+    rows += [(f"stage {name}", stats, baseline["stages"].get(name, {})) for name, stats in current["stages"].items()]
+
+    regressions = []
+    print(f"\n{'metric':<28}{'baseline p95':>14}{'current p95':>14}{'change':>10}")
+    for name, now, before in rows:
+        if not now.get("p95") or not before.get("p95"):
+            continue
+        change = now["p95"] / before["p95"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<28}{before['p95']:>14.4f}{now['p95']:>14.4f}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="backend/data", help="Directory scanned recursively for PDFs to ingest")
+    parser.add_argument("--queries", default="backend/benchmarks/queries.json")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=2, help="Times the query set is replayed")
+    parser.add_argument("--stream", action="store_true", help="Drive /query/stream instead of /query/")
+    parser.add_argument("--no-query-cache", action="store_true", help="Disable the /query/ response cache")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--work-dir", default=None, help="Defaults to a fresh temporary directory")
+    parser.add_argument("--output-dir", default="backend/benchmarks/results")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.10, help="Relative p95 increase reported as a regression")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="chatbot-bench-")
+    upload_store_dir = os.environ.get("UPLOAD_STORE_DIR", "backend/data/uploads")  # The real store, before it is redirected
+    configure_environment(work_dir, args)
+
+    from backend.benchmarks import fake_groq_server
+    fake_groq_server.settings.update(latency_ms=args.llm_latency_ms, tokens_per_second=args.llm_tokens_per_second)
+    start_server(fake_groq_server.app, FAKE_GROQ_PORT)
+
+    from backend.app import main as backend
+    from backend.app.core.timing import stage_samples, reset_stages
+    start_server(backend.app, APP_PORT)
+    while backend.startup_state["status"] == "starting":
+        time.sleep(0.1)
+    if backend.startup_state["status"] != "ready":
+        raise RuntimeError(f"Backend failed to start: {backend.startup_state['error']}")
+    print(f"Backend ready after {backend.startup_state['ready_after_seconds']:.2f}s: {backend.startup_state['phases']}")
+
+    files = collect_files(args.data_dir, [upload_store_dir])
+    print(f"Ingesting {len(files)} files from {args.data_dir} into {work_dir}")
+    reset_stages()
+    started = time.perf_counter()
+    backend.load_and_store_documents(files)
+    ingest_wall = time.perf_counter() - started
+    chunk_count = backend.db.count()
+    ingest_stages = stage_samples()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)["queries"]
+    print(f"Replaying {len(queries)} queries x{args.repeat} at concurrency {args.concurrency}")
+    reset_stages()
+    query_results = asyncio.run(drive_queries(queries, args.concurrency, args.repeat, args.stream))
+    query_stages = stage_samples()
+    rss = peak_rss_mb()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "startup": backend.startup_state,
+        "ingest": {
+            "files": len(files),
+            "chunks": chunk_count,
+            "wall_seconds": ingest_wall,
+            "files_per_second": len(files) / ingest_wall if ingest_wall else 0.0,
+            "chunks_per_second": chunk_count / ingest_wall if ingest_wall else 0.0,
+        },
+        "query": query_results,
+        "stages": {name: percentiles(samples) for name, samples in {**ingest_stages, **query_stages}.items()},
+        "query_cache": backend.query_cache.stats(),
+        "peak_rss_mb": rss,
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nIngest: {len(files)} files, {chunk_count} chunks in {ingest_wall:.1f}s")
+    latency = query_results["latency"]
+    if latency["count"]:
+        print(f"Query: {query_results['throughput_rps']:.2f} req/s, p50 {latency['p50']:.3f}s, "
+              f"p95 {latency['p95']:.3f}s, p99 {latency['p99']:.3f}s, {query_results['errors']} errors")
+    for name, stats in results["stages"].items():
+        print(f"  {name:<16} n={stats['count']:<6} p50 {stats['p50']:.4f}s  p95 {stats['p95']:.4f}s  p99 {stats['p99']:.4f}s")
+    print(f"Peak RSS: {rss['self']:.0f} MiB, {rss['workers']} pool workers "
+          f"(largest {rss['largest_worker']:.0f} MiB, {rss['workers_total']:.0f} MiB combined)")
+    print(f"Results written to {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.regression_threshold):
+            sys.exit(1)
+    # Daemon server threads and process pools are torn down with the interpreter.
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
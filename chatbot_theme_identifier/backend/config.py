@@ -2,3 +2,83 @@
 import os
 
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")  # Correct way to get it
+
+# Background ingestion (/upload/ jobs)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))  # Files are ingested by this many worker threads
+INGEST_MAX_PENDING_JOBS = int(os.environ.get("INGEST_MAX_PENDING_JOBS", "16"))  # Queued + running jobs before /upload/ returns 503
+INGEST_JOB_RETENTION = int(os.environ.get("INGEST_JOB_RETENTION", "500"))  # Finished jobs kept for GET /jobs/{id}
+SUPPORTED_UPLOAD_EXTENSIONS = (  # File types /upload/ accepts; others are rejected with 415
+    ".pdf", ".docx", ".txt", ".md", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp",
+)
+UPLOAD_STORE_DIR = os.environ.get("UPLOAD_STORE_DIR", "backend/data/uploads")  # Content-addressed upload storage
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))  # Uploads are streamed to disk this many bytes at a time
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))  # Larger files are rejected with 413
+
+# Document extraction and OCR
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))  # Processes parsing page ranges
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "8"))  # Pages handed to a parse process at a time
+OCR_MAX_WORKERS = int(os.environ.get("OCR_MAX_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))  # Concurrent Tesseract processes
+OCR_DPI = int(os.environ.get("OCR_DPI", "200"))  # Render resolution for scanned pages
+
+# Incremental ingestion
+INGEST_MANIFEST_PATH = os.environ.get("INGEST_MANIFEST_PATH", "backend/data/ingest_manifest.json")  # Per-file content hashes and chunk IDs
+INGEST_RECORD_BATCH = int(os.environ.get("INGEST_RECORD_BATCH", "256"))  # Paragraphs split and embedded together while a file streams in
+INGEST_FILES_IN_FLIGHT = int(os.environ.get("INGEST_FILES_IN_FLIGHT", "4"))  # Files of one job extracted and embedded concurrently
+
+# Embeddings
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "256"))  # Cache misses are encoded this many texts at a time
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "backend/data/embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))  # Least recently used vectors are evicted past this
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence-transformers")  # "sentence-transformers" (PyTorch), "onnx" (ONNX Runtime) or "remote" (embedding server)
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))  # Intra-op threads for the embedding model; 0 = library default
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "backend/data/onnx_model")  # Exported on first use if missing
+ONNX_QUANTIZE = os.environ.get("ONNX_QUANTIZE", "true").lower() in ("1", "true", "yes")  # int8 dynamic quantization of the ONNX weights
+
+# Shared embedding server (python -m backend.app.core.embedding_server; used when EMBEDDING_BACKEND="remote")
+EMBEDDING_SERVER_SOCKET = os.environ.get("EMBEDDING_SERVER_SOCKET", "backend/data/embedding.sock")  # Unix socket the server listens on
+EMBEDDING_SERVER_BACKEND = os.environ.get("EMBEDDING_SERVER_BACKEND", "sentence-transformers")  # Model backend the server loads
+EMBEDDING_SERVER_MAX_BATCH = int(os.environ.get("EMBEDDING_SERVER_MAX_BATCH", "64"))  # Texts from concurrent requests merged into one forward pass
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.environ.get("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))  # How long a request waits for others to join its batch
+EMBEDDING_SERVER_CONNECT_TIMEOUT = float(os.environ.get("EMBEDDING_SERVER_CONNECT_TIMEOUT", "60"))  # Clients wait this long for the server to come up
+EMBEDDING_SERVER_TIMEOUT = float(os.environ.get("EMBEDDING_SERVER_TIMEOUT", "120"))  # Per-request socket timeout; a wedged server raises instead of hanging
+
+# /query/ response cache
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_CACHE_TTL_SECONDS", "600"))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "1024"))  # Least recently used responses are evicted past this
+
+# Groq LLM client
+LLM_MODEL = os.environ.get("LLM_MODEL", "llama3-8b-8192")
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))  # Completions in flight across all requests
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))  # Pooled HTTP connections to Groq
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))  # Retries on rate limits and transient errors
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))  # Seconds; doubled on each retry
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "60"))
+
+# Hybrid retrieval
+LEXICAL_INDEX_PATH = os.environ.get("LEXICAL_INDEX_PATH", "backend/data/lexical_index.sqlite")  # On-disk BM25 inverted index
+LEXICAL_MAX_DF_RATIO = float(os.environ.get("LEXICAL_MAX_DF_RATIO", "0.5"))  # Query terms in more chunks than this are dropped when rarer terms exist
+HYBRID_CANDIDATE_MULTIPLIER = int(os.environ.get("HYBRID_CANDIDATE_MULTIPLIER", "4"))  # Each retriever returns k * this candidates for fusion
+RRF_K = int(os.environ.get("RRF_K", "60"))  # Reciprocal rank fusion damping constant
+
+# Vector store
+CHROMA_PERSIST_DIRECTORY = os.environ.get("CHROMA_PERSIST_DIRECTORY", "backend/data/chroma_db")
+VECTOR_SHARDS = int(os.environ.get("VECTOR_SHARDS", "4"))  # Collections chunks are partitioned across by source hash; rebalance after changing
+VECTOR_COLLECTION_PREFIX = os.environ.get("VECTOR_COLLECTION_PREFIX", "chunks")  # Shards are named <prefix>_00, <prefix>_01, ...
+
+# Corpus-wide theme index
+THEME_SOURCE = os.environ.get("THEME_SOURCE", "index")  # "index": nearest-centroid themes with LLM fallback; "llm": always ask the LLM
+THEME_INDEX_PATH = os.environ.get("THEME_INDEX_PATH", "backend/data/theme_index")  # Written as .npz (vectors) and .json (labels)
+THEME_CLUSTERS = int(os.environ.get("THEME_CLUSTERS", "0"))  # 0 picks sqrt(chunks / 2), clamped to [2, 64]
+THEME_MEMBER_CITATIONS = int(os.environ.get("THEME_MEMBER_CITATIONS", "5"))  # Representative citations stored per theme
+THEME_MAX_PER_QUERY = int(os.environ.get("THEME_MAX_PER_QUERY", "5"))
+
+# Prompt context packing
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))  # 1.0 = pure relevance, 0.0 = pure diversity
+THEME_CONTEXT_TOKEN_BUDGET = int(os.environ.get("THEME_CONTEXT_TOKEN_BUDGET", "1500"))  # Snippet tokens in the theme prompt
+ANSWER_CONTEXT_TOKEN_BUDGET = int(os.environ.get("ANSWER_CONTEXT_TOKEN_BUDGET", "3000"))  # Snippet tokens in the answer prompt
+
+# Observability
+PROFILE_SLOW_REQUEST_SECONDS = float(os.environ.get("PROFILE_SLOW_REQUEST_SECONDS", "0"))  # Requests slower than this get a sampled profile written; 0 disables
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))  # Stack sampling period while profiling
+PROFILE_OUTPUT_DIR = os.environ.get("PROFILE_OUTPUT_DIR", "backend/data/profiles")  # Collapsed-stack files, loadable by flamegraph.pl / speedscope
@@ -1,40 +1,238 @@
-import requests
+import argparse
+import hashlib
+import json
+import mimetypes
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from backend.config import SUPPORTED_UPLOAD_EXTENSIONS
+except ImportError:  # Run as a script from inside backend/
+    from config import SUPPORTED_UPLOAD_EXTENSIONS
 
 # Make sure your FastAPI backend is running (e.g., on http://localhost:8000)
 BACKEND_URL = "http://localhost:8000/upload/"
 DOCS_DIR = "backend/data/raw_docs/" # Adjust this path if your documents are elsewhere
+UPLOAD_MANIFEST = "upload_manifest.json"  # Written inside the uploaded folder; lets an interrupted run resume
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_documents(folder_path):
+    """Every supported file under `folder_path`, recursively, as (path, upload name) pairs."""
+    found = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() not in SUPPORTED_UPLOAD_EXTENSIONS:
+                continue
+            file_path = os.path.join(root, filename)
+            # The backend keys documents by file name, so nested files carry their folder in the name.
+            upload_name = os.path.relpath(file_path, folder_path).replace(os.sep, "__")
+            found.append((file_path, upload_name))
+    return found
+
+
+class UploadManifest:
+    """Content hashes of files the backend has accepted, saved after every batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, sha256):
+        return sha256 in self.entries
+
+    def record(self, uploads, job_id):
+        with self._lock:
+            for sha256, upload_name in uploads:
+                self.entries[sha256] = {"name": upload_name, "job_id": job_id, "uploaded_at": time.time()}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+
 
-def upload_documents_from_folder(folder_path):
-    uploaded_count = 0
-    failed_count = 0
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        if os.path.isfile(file_path) and filename.lower().endswith(".pdf"):
-            print(f"Uploading: {filename}...")
+def make_batches(documents, batch_files, batch_bytes):
+    """Groups documents into /upload/ calls of at most `batch_files` files and (unless a single file is bigger) `batch_bytes` bytes."""
+    batch, size = [], 0
+    for document in documents:
+        if batch and (len(batch) >= batch_files or size + document["size"] > batch_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append(document)
+        size += document["size"]
+    if batch:
+        yield batch
+
+
+def post_batch(session, url, batch, max_retries, timeout):
+    """Posts one batch as a multipart /upload/ request, retrying transient failures with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        handles = []
+        try:
+            files = []
+            for document in batch:
+                handle = open(document["path"], "rb")
+                handles.append(handle)
+                mime_type = mimetypes.guess_type(document["name"])[0] or "application/octet-stream"
+                files.append(("files", (document["name"], handle, mime_type)))
+            response = session.post(url, files=files, timeout=timeout)
+            if response.status_code not in RETRYABLE_STATUS:
+                response.raise_for_status()
+                return response.json()
+            retry_after = response.headers.get("Retry-After")
+            error = requests.HTTPError(f"{response.status_code} {response.reason}", response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            retry_after, error = None, e
+        finally:
+            for handle in handles:
+                handle.close()
+
+        if attempt == max_retries:
+            raise error
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt * (0.5 + random.random())
+        print(f"Retrying batch of {len(batch)} in {delay:.1f}s ({error})")
+        time.sleep(delay)
+
+
+def wait_for_job(session, url, job, poll_interval, job_timeout, missing_timeout):
+    """
+    Polls the job an /upload/ call queued until it finishes; returns {file name: status}.
+
+    A 202 from /upload/ only means the files were queued. Jobs live in the memory of the
+    uvicorn worker that accepted the upload, so with several workers a poll answered by
+    another one gets a 404; every poll therefore opens a fresh connection, and a 404 is
+    retried until none of them has known the job for `missing_timeout` seconds (the backend
+    restarted and lost its queue). A lost job, or one that outlives `job_timeout`, yields
+    no statuses, so its files are retried on the next run.
+    """
+    status_url = urljoin(url, job["status_url"])
+    deadline = time.monotonic() + job_timeout
+    missing_since = None
+    while time.monotonic() < deadline:
+        try:
+            response = session.get(status_url, timeout=30, headers={"Connection": "close"})
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(poll_interval)
+            continue
+        if response.status_code == 404:
+            missing_since = missing_since or time.monotonic()
+            if time.monotonic() - missing_since >= missing_timeout:
+                return {}
+            time.sleep(poll_interval)
+            continue
+        missing_since = None
+        response.raise_for_status()
+        status = response.json()
+        if status["status"] in ("completed", "failed"):
+            return {f["file_name"]: f["status"] for f in status["files"]}
+        time.sleep(poll_interval)
+    return {}
+
+
+def upload_batch(session, url, batch, max_retries, timeout, poll_interval, job_timeout, missing_timeout):
+    job = post_batch(session, url, batch, max_retries, timeout)
+    return job.get("job_id"), wait_for_job(session, url, job, poll_interval, job_timeout, missing_timeout)
+
+
+def upload_documents_from_folder(folder_path, url=BACKEND_URL, workers=4, batch_files=8, batch_bytes=50 * 1024 * 1024,
+                                 max_retries=5, timeout=300, manifest_path=None, poll_interval=2.0, job_timeout=3600,
+                                 missing_timeout=120):
+    started = time.perf_counter()
+    manifest = UploadManifest(manifest_path or os.path.join(folder_path, UPLOAD_MANIFEST))
+
+    pending, skipped = [], 0
+    seen = set()
+    for file_path, upload_name in find_documents(folder_path):
+        sha256 = file_sha256(file_path)
+        if sha256 in manifest or sha256 in seen:
+            skipped += 1
+            continue
+        seen.add(sha256)
+        pending.append({"path": file_path, "name": upload_name, "sha256": sha256, "size": os.path.getsize(file_path)})
+    print(f"Found {len(pending) + skipped} documents: {skipped} already uploaded, {len(pending)} to upload")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    uploaded_count = failed_count = uploaded_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(upload_batch, session, url, batch, max_retries, timeout, poll_interval, job_timeout, missing_timeout): batch
+            for batch in make_batches(pending, batch_files, batch_bytes)
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
             try:
-                with open(file_path, "rb") as f:
-                    files = {"files": (filename, f, "application/pdf")}
-                    response = requests.post(BACKEND_URL, files=files)
-                    response.raise_for_status() # Raise an exception for HTTP errors
-                    print(f"Successfully uploaded {filename}: {response.json()}")
-                    uploaded_count += 1
-            except requests.exceptions.RequestException as e:
-                print(f"Failed to upload {filename}: {e}")
-                failed_count += 1
+                job_id, statuses = future.result()
             except Exception as e:
-                print(f"An unexpected error occurred with {filename}: {e}")
-                failed_count += 1
-        else:
-            print(f"Skipping non-PDF file or directory: {filename}")
+                print(f"Failed to upload {', '.join(document['name'] for document in batch)}: {e}")
+                failed_count += len(batch)
+                continue
+            # Only files the backend finished ingesting are recorded; the rest are retried on resume.
+            completed = [document for document in batch if statuses.get(document["name"]) == "completed"]
+            manifest.record([(document["sha256"], document["name"]) for document in completed], job_id)
+            uploaded_count += len(completed)
+            uploaded_bytes += sum(document["size"] for document in completed)
+            failed_count += len(batch) - len(completed)
+            for document in batch:
+                print(f"{statuses.get(document['name'], 'lost'):>9}  {document['name']} (job {job_id})")
+    session.close()
 
+    elapsed = time.perf_counter() - started
     print(f"\n--- Upload Summary ---")
     print(f"Total files attempted: {uploaded_count + failed_count}")
-    print(f"Successfully uploaded: {uploaded_count}")
-    print(f"Failed uploads: {failed_count}")
+    print(f"Successfully ingested: {uploaded_count}")
+    print(f"Skipped (already uploaded): {skipped}")
+    print(f"Failed or not ingested: {failed_count}")
+    if elapsed > 0:
+        print(f"Throughput: {uploaded_count / elapsed:.2f} files/s, {uploaded_bytes / elapsed / (1024 * 1024):.2f} MiB/s over {elapsed:.1f}s")
+    return failed_count
+
 
 if __name__ == "__main__":
-    if not os.path.exists(DOCS_DIR):
-        print(f"Error: Document directory '{DOCS_DIR}' not found. Please create it and place your PDFs inside.")
+    parser = argparse.ArgumentParser(description="Bulk-upload documents to the backend's /upload/ endpoint.")
+    parser.add_argument("folder", nargs="?", default=DOCS_DIR, help="Folder scanned recursively for supported documents")
+    parser.add_argument("--url", default=BACKEND_URL)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent /upload/ requests")
+    parser.add_argument("--batch-files", type=int, default=8, help="Files per /upload/ request")
+    parser.add_argument("--batch-mb", type=float, default=50, help="Approximate size cap per /upload/ request")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--manifest", default=None, help=f"Resume manifest (default: <folder>/{UPLOAD_MANIFEST})")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between /jobs/{id} polls")
+    parser.add_argument("--job-timeout", type=float, default=3600, help="Give up waiting on a job after this many seconds")
+    parser.add_argument("--missing-timeout", type=float, default=120,
+                        help="Treat a job as lost after /jobs/{id} has answered 404 for this many seconds "
+                             "(with several uvicorn workers, polls answered by other workers 404)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.folder):
+        print(f"Error: Document directory '{args.folder}' not found. Please create it and place your documents inside.")
     else:
-        upload_documents_from_folder(DOCS_DIR)
\ No newline at end of file
+        failed = upload_documents_from_folder(args.folder, args.url, args.workers, args.batch_files, int(args.batch_mb * 1024 * 1024),
+                                              args.retries, manifest_path=args.manifest, poll_interval=args.poll_interval,
+                                              job_timeout=args.job_timeout, missing_timeout=args.missing_timeout)
+        raise SystemExit(1 if failed else 0)
@@ -11,6 +11,27 @@ document.addEventListener('DOMContentLoaded', () => {
     // Your Vercel `routes` in vercel.json will handle routing /api requests to your backend
     const BACKEND_BASE_URL = "/api"; 
 
+    // --- Ingestion Job Polling ---
+    // /upload/ returns immediately with a job ID; parsing and embedding run in the background.
+    async function pollJobStatus(jobId) {
+        while (true) {
+            const response = await fetch(`${BACKEND_BASE_URL}/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`Could not fetch job status (HTTP ${response.status})`);
+            }
+            const job = await response.json();
+            const fileSummaries = job.files.map(f =>
+                `${f.file_name}: ${f.pages_parsed}/${f.pages_total} pages, ${f.chunks_embedded} chunks` +
+                (f.failures.length > 0 ? ` (failed: ${f.failures.join('; ')})` : '')
+            );
+            uploadStatus.textContent = `Processing (${job.status}) - ${fileSummaries.join(' | ')}`;
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     // --- Document Upload Logic ---
     uploadButton.addEventListener('click', async () => {
         const files = documentUpload.files;
@@ -39,6 +60,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
             const result = await response.json();
             uploadStatus.textContent = `Upload successful: ${result.message}`;
+            if (result.job_id) {
+                await pollJobStatus(result.job_id);
+            }
         } catch (error) {
             uploadStatus.textContent = `Upload failed: ${error.message}`;
             console.error('Upload error:', error);
@@ -46,6 +70,73 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     // --- Query and Display Logic ---
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function renderThemes(themes) {
+        if (!themes || themes.length === 0) {
+            return '';
+        }
+        let themesContent = `<h4>Identified Themes:</h4><ul>`;
+        themes.forEach(themeItem => {
+            themesContent += `<li><strong>${themeItem.theme_name}:</strong> `;
+            if (themeItem.theme_description) {
+                 themesContent += `${themeItem.theme_description} `;
+            }
+            if (themeItem.citations && themeItem.citations.length > 0) {
+                const docIds = [...new Set(themeItem.citations.map(c => c.document_id))].join(', ');
+                themesContent += `(Documents: ${docIds})`; // Concise display of Document IDs
+            } else {
+                themesContent += 'No specific citations found for this theme.';
+            }
+            themesContent += `</li>`;
+        });
+        themesContent += `</ul>`;
+        return themesContent;
+    }
+
+    function renderCitationRows(citations) {
+        documentResponsesTableBody.innerHTML = '';
+        citations.forEach(citation => {
+            const row = documentResponsesTableBody.insertRow();
+            row.insertCell().textContent = citation.document_id;
+            row.insertCell().textContent = citation.snippet_text.substring(0, 200);
+            row.insertCell().textContent = `${citation.source}, Page: ${citation.page_number}, Paragraph Start-End: ${citation.paragraph_start}-${citation.paragraph_end}`;
+        });
+    }
+
+    // Parses a Server-Sent Events body from /query/stream and calls onEvent(name, data) per event.
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let eventName = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        eventName = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                });
+                onEvent(eventName, data ? JSON.parse(data) : null);
+            }
+        }
+    }
+
     askButton.addEventListener('click', async () => {
         const query = queryInput.value.trim();
 
@@ -60,7 +151,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const requestBody = JSON.stringify({ query: query });
 
         try {
-            const response = await fetch(`${BACKEND_BASE_URL}/query/`, {
+            // The streaming endpoint sends citations first, then answer tokens, then themes.
+            const response = await fetch(`${BACKEND_BASE_URL}/query/stream`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -74,53 +166,37 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.detail || errorData.message || `HTTP error! Status: ${response.status}`);
             }
 
-            const result = await response.json();
-            console.log("Query Result:", result);
-
-            // Display Synthesized Answer (Chat Format)
-            if (result.answer) {
-                let chatContent = `<p><strong>Query:</strong> ${result.original_query}</p>`;
-                chatContent += `<p><strong>Answer:</strong> ${result.answer}</p>`;
-
-                if (result.themes && result.themes.length > 0) {
-                    chatContent += `<h4>Identified Themes:</h4><ul>`;
-                    result.themes.forEach(themeItem => {
-                        chatContent += `<li><strong>${themeItem.theme_name}:</strong> `;
-                        if (themeItem.theme_description) {
-                             chatContent += `${themeItem.theme_description} `;
-                        }
-                        if (themeItem.citations && themeItem.citations.length > 0) {
-                            const docIds = [...new Set(themeItem.citations.map(c => c.document_id))].join(', ');
-                            chatContent += `(Documents: ${docIds})`; // Concise display of Document IDs
-                            // IMPORTANT: The detailed citation list (with snippets) is intentionally REMOVED here
-                            // to keep the themes section clean, as per the desired output format.
-                            // If you need detailed citations, consider a separate "Relevant Snippets" section below the main answer.
-                        } else {
-                            chatContent += 'No specific citations found for this theme.';
-                        }
-                        chatContent += `</li>`;
-                    });
-                    chatContent += `</ul>`;
+            let answerText = '';
+            let themesContent = '';
+            const renderChat = () => {
+                // Display Synthesized Answer (Chat Format)
+                synthesizedAnswerDiv.innerHTML = `<p><strong>Query:</strong> ${escapeHtml(query)}</p>` +
+                    `<p><strong>Answer:</strong> ${escapeHtml(answerText)}</p>` + themesContent;
+            };
+
+            await readEventStream(response, (eventName, data) => {
+                if (eventName === 'citations') {
+                    renderCitationRows(data);
+                    synthesizedAnswerDiv.innerHTML = 'Generating answer...';
+                } else if (eventName === 'token') {
+                    answerText += data.text;
+                    renderChat();
+                } else if (eventName === 'themes') {
+                    themesContent = renderThemes(data);
+                    renderChat();
+                } else if (eventName === 'error') {
+                    answerText = data.message;
+                    renderChat();
+                } else if (eventName === 'done') {
+                    console.log("Query Result:", data);
+                    if (!data.answer) {
+                        synthesizedAnswerDiv.innerHTML = '<p>No synthesized answer found.</p>';
+                    }
                 }
-                synthesizedAnswerDiv.innerHTML = chatContent;
-            } else {
-                synthesizedAnswerDiv.innerHTML = '<p>No synthesized answer found.</p>';
-            }
+            });
 
-            // Display Individual Document Responses (Tabular Format)
-            // This section will only show content if the backend explicitly sends 'tabular_results'
-            // which typically happens when the `output_format` in the query request is set to "tabular".
-            if (result.tabular_results && result.tabular_results.length > 0) {
-                documentResponsesTableBody.innerHTML = ''; // Clear previous table content
-                result.tabular_results.forEach(item => {
-                    const row = documentResponsesTableBody.insertRow();
-                    row.insertCell().textContent = item["Document ID"];
-                    row.insertCell().textContent = item["Extracted Answer"];
-                    row.insertCell().textContent = item["Citation"];
-                });
-            } else {
-                // Optionally, you can clear the table or show a message if no tabular results are expected/found
-                documentResponsesTableBody.innerHTML = `<tr><td colspan="3" class="no-results-message">No individual document responses (tabular format) found for this query type.</td></tr>`;
+            if (documentResponsesTableBody.rows.length === 0) {
+                documentResponsesTableBody.innerHTML = `<tr><td colspan="3" class="no-results-message">No individual document responses found for this query.</td></tr>`;
             }
 
         } catch (error) {